@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Benchmark of Lingea Dictionary (.trd) decoder on synthetic dictionaries
+#
+# Synthetic .trd files are written by the encoder in lingea_trd_synthetic.py,
+# in small and large variant. Throughput of index build, alphabet decoding, record parsing,
+# tag postprocessing and whole conversion is reported in records/s and MB/s.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Library General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import getopt, sys
+def usage():
+   print "Lingea Dictionary Decoder Benchmark"
+   print "-----------------------------------"
+   print
+   print "Usage: python lingea-trd-benchmark.py [options] [DICTIONARY.trd ...]"
+   print "Without dictionaries synthetic small and large dictionaries are generated"
+   print
+   print "    -n <num>      --records          : Number of records of synthetic dictionaries (20000)"
+   print "    -s <num>      --seed             : Seed of random generator (1)"
+   print "    -r <num>      --repeat           : Best time of <num> runs of every stage (3)"
+   print "    -k <dir>      --keep             : Write synthetic dictionaries to <dir> and keep them"
+   print "    -h            --help             : Print this message"
+   print
+
+try:
+   opts, args = getopt.getopt(sys.argv[1:], "hn:s:r:k:", ["help", "records=", "seed=", "repeat=", "keep="])
+except getopt.GetoptError:
+   usage()
+   print "ERROR: Bad option"
+   sys.exit(2)
+
+import locale
+RECORDS = 20000
+SEED = 1
+REPEAT = 3
+KEEP = None
+for o, a in opts:
+   if o in ("-h", "--help"):
+      usage()
+      sys.exit(0)
+   if o in ("-n", "--records"):
+      RECORDS = locale.atoi(a)
+   if o in ("-s", "--seed"):
+      SEED = locale.atoi(a)
+   if o in ("-r", "--repeat"):
+      REPEAT = locale.atoi(a)
+   if o in ("-k", "--keep"):
+      KEEP = a
+
+from lingea_trd import *
+from lingea_trd_synthetic import *
+import os, shutil, tempfile, time
+
+################################################################
+# BENCHMARK
+################################################################
+
+def best_time(function):
+    """Best time of REPEAT runs of function"""
+    best = None
+    for k in range(REPEAT):
+        start = time.time()
+        function()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def benchmark(path):
+    """Time stages of decoding of dictionary, return list of (stage, records, bytes, seconds)"""
+    results = []
+    dictionary = Dictionary(path)
+    records = range(1, dictionary.entryCount)
+    size = os.path.getsize(path)
+    results.append(("index", len(records), size, best_time(lambda: Dictionary(path))))
+
+    # strings and raw records are collected once, decoding of records has to end well
+    streams = []
+    raw = []
+    for i in records:
+        reader = StringPositions(dictionary.getRec(i), dictionary)
+        raw.append(format_record(parse(reader, dictionary), dictionary.tag))
+        streams.append((reader.bs, reader.positions))
+    recordBytes = sum([len(bs) for bs, positions in streams])
+
+    def alpha():
+        for bs, positions in streams:
+            for p in positions:
+                decode_alpha_groups(bs, p, dictionary)
+    results.append(("alpha", len(records), recordBytes, best_time(alpha)))
+
+    def parse_records():
+        for i in records:
+            parse(RecordReader(dictionary.getRec(i), dictionary), dictionary)
+    results.append(("parse", len(records), recordBytes, best_time(parse_records)))
+
+    def tag_postprocessing():
+        for s in raw:
+            decode_tag_postprocessing(s, dictionary.outStyle)
+    results.append(("tags", len(records), sum([len(s) for s in raw]), best_time(tag_postprocessing)))
+
+    def convert():
+        d = Dictionary(path)
+        out = OutputBuffer(open(os.devnull, 'wb'))
+        for i in xrange(1, d.entryCount):
+            out.write(decode(RecordReader(d.getRec(i), d), d))
+        out.close()
+    results.append(("convert", len(records), size, best_time(convert)))
+    return results
+
+################################################################
+# MAIN
+################################################################
+
+if args:
+    paths = args
+    directory = None
+else:
+    directory = KEEP or tempfile.mkdtemp()
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    paths = [os.path.join(directory, "synthetic-small.trd"), os.path.join(directory, "synthetic-large.trd")]
+    generate(paths[0], RECORDS, True, SEED)
+    generate(paths[1], RECORDS, False, SEED)
+
+try:
+    print "%-24s %-8s %9s %9s %8s %10s %8s" % ("dictionary", "stage", "records", "MB", "s", "rec/s", "MB/s")
+    for path in paths:
+        for stage, count, size, seconds in benchmark(path):
+            seconds = max(seconds, 1e-6)
+            print "%-24s %-8s %9d %9.2f %8.3f %10.0f %8.2f" % (os.path.basename(path), stage, count, size / 1048576.0, seconds, count / seconds, size / 1048576.0 / seconds)
+finally:
+    if directory is not None and KEEP is None:
+        shutil.rmtree(directory)
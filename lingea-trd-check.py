@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Differential check of Lingea Dictionary (.trd) decoder on synthetic data
+#
+# Table-driven decoding stages of lingea_trd.py are compared with reference
+# implementations written the straightforward way of the original decoder:
+# alphabet decoding at every string of synthetic dictionaries (encoder in
+# lingea_trd_synthetic.py), symbol combination of random symbol codes,
+# pronunciation symbols and inline tag rewriting of random (nested) tags.
+# Exit status is 1 if any result differs.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Library General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import getopt, sys
+def usage():
+   print "Lingea Dictionary Decoder Check"
+   print "-------------------------------"
+   print
+   print "Usage: python lingea-trd-check.py [options]"
+   print
+   print "    -n <num>      --records          : Number of records of synthetic dictionaries (2000)"
+   print "    -c <num>      --cases            : Number of random cases of every other check (20000)"
+   print "    -s <num>      --seed             : Seed of random generator (1)"
+   print "    -h            --help             : Print this message"
+   print
+
+try:
+   opts, args = getopt.getopt(sys.argv[1:], "hn:c:s:", ["help", "records=", "cases=", "seed="])
+except getopt.GetoptError:
+   usage()
+   print "ERROR: Bad option"
+   sys.exit(2)
+
+import locale
+RECORDS = 2000
+CASES = 20000
+SEED = 1
+for o, a in opts:
+   if o in ("-h", "--help"):
+      usage()
+      sys.exit(0)
+   if o in ("-n", "--records"):
+      RECORDS = locale.atoi(a)
+   if o in ("-c", "--cases"):
+      CASES = locale.atoi(a)
+   if o in ("-s", "--seed"):
+      SEED = locale.atoi(a)
+
+from lingea_trd import *
+from lingea_trd_synthetic import *
+import os, random, shutil, tempfile
+
+################################################################
+# REFERENCE IMPLEMENTATIONS
+################################################################
+
+def reference_alpha(stream, start, dictionary):
+    """Decode 6-bit encoding data stream from the start position until first NULL, symbol after symbol"""
+    offset = 0
+    triple = start
+    result = []
+    while triple < len(stream):
+        if offset % 4 == 0:
+            c = stream[triple] >> 2
+            triple += 1
+        if offset % 4 == 1:
+            c = (stream[triple-1] & 3) << 4 | stream[triple] >> 4
+            triple += 1
+        if offset % 4 == 2:
+            c = (stream[triple-1] & 15) << 2 | (stream[triple] & 192) >> 6
+            triple += 1
+        if offset % 4 == 3:
+            c = stream[triple-1] & 63
+        if c == 0:
+            break
+        offset += 1
+        result.append(c)
+    return reference_alpha_postprocessing(result, dictionary), triple - start - 1
+
+def reference_alpha_postprocessing(input, dictionary):
+    """Combine symbols by lookups of their names in alphabet and subs rules"""
+    alpha = dictionary.alpha
+    subs = dictionary.subs
+    result = ""
+    input = input + [0x00]*5
+    skip = 0
+    for i in range(0, len(input)-1):
+        if skip > 0:
+            skip -= 1
+            continue
+        c = alpha[input[i]]
+        c1 = alpha[input[i+1]]
+        if c[0] == '#':
+            skip = 1
+            if c in subs:
+                if c in ("#UPCASE#", "#SPECIAL#", "#SYMBOL#"):
+                    result += subs[c][input[i+1]]
+                elif c == "#PRON#":
+                    cc = c1 + alpha[input[i+2]]
+                    result += subs[c].get(cc, c + cc)
+                    skip = 2
+                else:
+                    result += subs[c].get(c1, c + c1)
+            else:
+                result += c
+        else:
+            result += c
+    return result
+
+def reference_pronunciation(s, dictionary):
+    """Replace upcase symbols by IPA symbols one after another"""
+    for u, p in zip(dictionary.upcase, upcase_pron):
+        s = s.replace(u, p)
+    return s
+
+# Replacement of inline tags of output style 2, other styles use ( )
+referenceTags = [(letter, '<span size="small" color="blue" style="italic">', '</span>') for letter in 'acdeEfghiIlLnNopqrtuvwxyz^']
+referenceTags[2] = ('d', '<span size="small" color="blue">(', ')</span>')
+referenceTags[22] = ('x', '<span size="small" color="brown" style="italic">', '</span>')
+
+def reference_tags(s, outStyle):
+    """Rewrite inline tags letter after letter"""
+    for letter, prefix, suffix in referenceTags:
+        if outStyle != 2:
+            prefix, suffix = '(', ')'
+        s = re.sub('<' + re.escape(letter) + '(.*?)>', lambda m: prefix + m.group(1) + suffix, s)
+    return s
+
+################################################################
+# CHECKS
+################################################################
+
+def outcome(function, *args):
+    """Result of function or type of its exception, symbols outside of tables have to fail alike"""
+    try:
+        return function(*args)
+    except IndexError:
+        return IndexError
+
+class Check(object):
+    """Number of compared cases and first mismatches of one check"""
+    __slots__ = ('name', 'cases', 'mismatches', 'examples')
+
+    def __init__(self, name):
+        self.name = name
+        self.cases = 0
+        self.mismatches = 0
+        self.examples = []
+
+    def compare(self, case, found, expected):
+        self.cases += 1
+        if found != expected:
+            self.mismatches += 1
+            if len(self.examples) < 5:
+                self.examples.append("%s: %r != %r" % (case, found, expected))
+
+class ReferenceReader(StringPositions):
+    """Record reader decoding strings by reference_alpha(), remembering positions of strings"""
+    __slots__ = ()
+
+    def read_str(self, comment = ""):
+        pos = self.pos
+        self.positions.append(pos)
+        s, triple = reference_alpha(self.bs, pos, self.dictionary)
+        self.pos = pos + triple + 1
+        return s.split('\x00')[0].replace('`','')
+
+def check_alpha(check, dictionary):
+    """Compare alphabet decoders at every string of every record, strings are found by the reference decoder"""
+    for i in xrange(1, dictionary.entryCount):
+        reader = ReferenceReader(dictionary.getRec(i), dictionary)
+        parse(reader, dictionary)
+        for p in reader.positions:
+            check.compare("record %s at %s" % (i, p), outcome(decode_alpha_groups, reader.bs, p, dictionary),
+                          outcome(reference_alpha, reader.bs, p, dictionary))
+
+def check_symbols(check, r, dictionary):
+    """Compare symbol combination of random symbol codes, combining symbols are frequent"""
+    combining = [code for code, c in enumerate(dictionary.alpha) if c[0] == '#']
+    for k in xrange(CASES):
+        codes = [r.random() < 0.3 and r.choice(combining) or r.randint(0, 63) for n in range(r.randint(0, 12))]
+        check.compare(codes, outcome(decode_alpha_postprocessing, list(codes), dictionary),
+                      outcome(reference_alpha_postprocessing, codes, dictionary))
+
+def check_pronunciation(check, r, dictionary):
+    """Compare pronunciation encoding of random texts of upcase symbols"""
+    pieces = list(dictionary.upcase) + ['a', ' ', '#', 'upr']
+    for k in xrange(CASES):
+        s = ''.join([r.choice(pieces) for n in range(r.randint(0, 8))])
+        check.compare(s, pronunciation_encode(s, dictionary), reference_pronunciation(s, dictionary))
+
+def check_tags(check, r):
+    """Compare inline tag rewriting of random texts with nested and unclosed tags"""
+    pieces = ['<' + letter for letter in inlineTagLetters] + ['<', '>', '>', 'ab', ' ', '<b']
+    for k in xrange(CASES):
+        s = ''.join([r.choice(pieces) for n in range(r.randint(0, 10))])
+        for outStyle in (0, 1, 2):
+            check.compare((s, outStyle), decode_tag_postprocessing(s, outStyle), reference_tags(s, outStyle))
+
+################################################################
+# MAIN
+################################################################
+
+directory = tempfile.mkdtemp()
+checks = []
+try:
+    r = random.Random(SEED)
+    for name, smallIndex in (("small", True), ("large", False)):
+        path = os.path.join(directory, "synthetic-%s.trd" % name)
+        generate(path, RECORDS, smallIndex, SEED)
+        dictionary = Dictionary(path)
+        checks.append(Check("alpha-" + name))
+        check_alpha(checks[-1], dictionary)
+        checks.append(Check("symbols-" + name))
+        check_symbols(checks[-1], r, dictionary)
+        checks.append(Check("pron-" + name))
+        check_pronunciation(checks[-1], r, dictionary)
+    checks.append(Check("tags"))
+    check_tags(checks[-1], r)
+finally:
+    shutil.rmtree(directory)
+
+print "%-16s %10s %10s" % ("check", "cases", "mismatches")
+for check in checks:
+    print "%-16s %10d %10d" % (check.name, check.cases, check.mismatches)
+    for example in check.examples:
+        print "    " + example
+if [check for check in checks if check.mismatches]:
+    sys.exit(1)
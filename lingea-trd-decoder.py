@@ -95,25 +95,63 @@ def usage():
    print "Copyright (C) 2007 - Klokan Petr Pridal, Petr Dlouhy"
    print
    print "Usage: python lingea-trd-decoder.py DICTIONARY.trd > DICTIONARY.tab"
+   print "       python lingea-trd-decoder.py -f DICTIONARY.tab DICTIONARY.trd"
+   print "       python lingea-trd-decoder.py -s DICTIONARY DICTIONARY.trd"
+   print "       python lingea-trd-decoder.py -b OUTDIR [-j <num>] DIRECTORY"
+   print "       python lingea-trd-decoder.py -v REPORT.json [-j <num>] DIRECTORY"
    print "Result conversion by stardict-tools: /usr/lib/stardict-tools/tabfile"
    print
    print "    -o <num>      --out-style        : Output style"
    print "                                          0   no tags"
    print "                                          1   \\n tags"
    print "                                          2   html tags"
+   print "    -f <file>     --output           : Write result to <file> instead of standard output"
+   print "    -m <list>     --formats          : Decode every record once and write it in all formats"
+   print "                                       of comma separated <list> of output styles 0, 1, 2"
+   print "                                       and json to files OUTPUT.txt, OUTPUT.tab, OUTPUT.htm"
+   print "                                       and OUTPUT.json (OUTPUT given by -f)"
+   print "    -u            --update           : Update output file given by -f, decode just records"
+   print "                                       changed since the previous run (hashes are kept"
+   print "                                       in OUTPUT.rh), copy the others from previous output"
+   print "    -s <base>     --stardict         : Write StarDict dictionary <base>.ifo, <base>.idx"
+   print "                                       and <base>.dict, no tabfile conversion is needed"
+   print "    -z            --dictzip          : Compress StarDict dictionary to <base>.dict.dz"
+   print "    -x <file>     --columns          : Write headwords and definitions to memory mappable"
+   print "                                       columnar file <file> (see ColumnReader)"
+   print "                  --sorted           : Add permutation of entries sorted by headword to <file>"
+   print "    -b <dir>      --batch            : Convert all .trd files found in DIRECTORY to"
+   print "                                       <dir>/PATH/NAME.txt, .tab or .htm by output style,"
+   print "                                       largest first, in <num> parallel processes;"
+   print "                                       up to date files are skipped"
+   print "    -v <file>     --validate         : Validate all .trd files found in DIRECTORY (or one"
+   print "                                       .trd file) in <num> parallel processes, write JSON"
+   print "                                       report of wrong records, unknown symbols and"
+   print "                                       unhandled flag bits to <file>"
+   print "                  --profile          : Print time and calls of decoding stages, histograms"
+   print "                                       of record sizes and flags as JSON to standard error,"
+   print "                                       records are decoded in one process"
    print "    -h            --help             : Print this message"
    print "    -d            --debug            : Debug"
    print "    -r            --debug-header     : Debug - print headers"
    print "    -a            --debug-all        : Debug - print all records"
    print "    -l            --debug-limit      : Debug limit"
+   print "                                       Debug validates all records (in <num> parallel"
+   print "                                       processes with -j), prints debug of first <limit>"
+   print "                                       wrong records and list of all wrong records"
+   print "    -j <num>      --jobs             : Decode records in <num> parallel processes"
+   print "    -w <word>     --lookup           : Print just records with headword <word> as printed by -n"
+   print "    -p <prefix>   --lookup-prefix    : Print just records with headwords starting by <prefix> (-n form)"
+   print "    -n            --headwords        : Print just headwords, one per line"
+   print "    -i            --index-cache      : Use index cache DICTIONARY.trd.idx, create it if"
+   print "                                       missing or outdated"
    print
-   print "For HTML support in StarDict dictionary .ifo has to contain:"
+   print "For HTML support in StarDict dictionary converted by tabfile .ifo has to contain:"
    print "sametypesequence=g"
    print "!!! Change the .ifo file after generation by tabfile !!!"
    print
 
 try:
-   opts, args = getopt.getopt(sys.argv[1:], "hdo:ral:e:", ["help", "debug", "out-style=", "debug-header", "debug-all", "debug-limit="])
+   opts, args = getopt.getopt(sys.argv[1:], "hdo:f:m:us:zx:b:v:ral:e:j:iw:p:n", ["help", "debug", "out-style=", "output=", "formats=", "update", "stardict=", "dictzip", "columns=", "sorted", "batch=", "validate=", "profile", "debug-header", "debug-all", "debug-limit=", "jobs=", "index-cache", "lookup=", "lookup-prefix=", "headwords"])
 except getopt.GetoptError:
    usage()
    print "ERROR: Bad option"
@@ -125,6 +163,21 @@ OUTSTYLE = 2
 DEBUGHEADER = False
 DEBUGALL = False
 DEBUGLIMIT = 1
+JOBS = 1
+INDEXCACHE = False
+LOOKUP = None
+LOOKUPPREFIX = False
+HEADWORDS = False
+OUTPUT = None
+FORMATS = None
+UPDATE = False
+STARDICT = None
+DICTZIP = False
+COLUMNS = None
+SORTED = False
+BATCH = None
+VALIDATE = None
+PROFILE = False
 for o, a in opts:
    if o in ("-d", "-debug"):
       # DEBUGING !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
@@ -136,6 +189,45 @@ for o, a in opts:
          usage()
          print "ERROR: Output style not specified"
          sys.exit(2)
+   if o in ("-f", "--output"):
+      # Output file, standard output by default
+      OUTPUT = a
+   if o in ("-m", "--formats"):
+      # Output formats written from one decoding of records
+      FORMATS = []
+      for f in a.split(','):
+         if f in ('0', '1', '2'):
+            FORMATS.append(int(f))
+         elif f == 'json':
+            FORMATS.append(f)
+         else:
+            usage()
+            print "ERROR: Unknown output format %s" % f
+            sys.exit(2)
+   if o in ("-u", "--update"):
+      # Incremental conversion of records changed since previous output
+      UPDATE = True
+   if o in ("-s", "--stardict"):
+      # Base name of StarDict dictionary files
+      STARDICT = a
+   if o in ("-z", "--dictzip"):
+      # Compress .dict file of StarDict dictionary
+      DICTZIP = True
+   if o in ("-x", "--columns"):
+      # Columnar export file
+      COLUMNS = a
+   if o == "--sorted":
+      # Sorted permutation of entries in columnar export
+      SORTED = True
+   if o in ("-b", "--batch"):
+      # Output directory of batch conversion
+      BATCH = a
+   if o in ("-v", "--validate"):
+      # Report file of validation of dictionaries
+      VALIDATE = a
+   if o == "--profile":
+      # Profile stages of decoding
+      PROFILE = True
    if o in ("-r", "--debug-header"):
       # If DEBUG and DEBUGHEADER, then print just all header records
       DEBUGHEADER = True
@@ -148,7 +240,23 @@ for o, a in opts:
    if o in ("-l", "--debug-limit"):
       # Number of wrong records for printing to stop during debugging 
       DEBUGLIMIT = locale.atoi(a)
-# FILENAME is a first parameter on the command line now
+   if o in ("-j", "--jobs"):
+      # Number of worker processes decoding records
+      JOBS = locale.atoi(a)
+   if o in ("-i", "--index-cache"):
+      # Load index from sidecar file instead of decoding the index structure
+      INDEXCACHE = True
+   if o in ("-w", "--lookup"):
+      # Decode just records with given headword
+      LOOKUP = a
+   if o in ("-p", "--lookup-prefix"):
+      # Decode just records with headwords with given prefix
+      LOOKUP = a
+      LOOKUPPREFIX = True
+   if o in ("-n", "--headwords"):
+      # Decode just header blocks and print record names
+      HEADWORDS = True
+# FILENAME is a first parameter on the command line now, directory of dictionaries in batch mode
 
 if len(args) == 1:
     FILENAME = args[0]
@@ -157,810 +265,489 @@ else:
    print "ERROR: You have to specify .trd file to decode"
    sys.exit(2)
 
-from struct import *
-import re
-
-
-if OUTSTYLE == 0:
-    tag = {
-           'db':(''   ,''),    #Data beginning
-           'rn':(''   ,'\t'),  #Record name
-           'va':(''   ,' '),   #Header variant
-           'wc':('('  ,')'),   #WordClass
-           'pa':(''   ,' '),   #Header parts
-           'fo':('('  ,') '),  #Header forms
-           'on':('('  ,')' ),  #Header origin note
-           'pr':('['  ,']'),   #Header pronunciation; not printed by Lingea
-           'du':('('  ,')'),   #Data sub example
-           'dc':('('  ,')'),   #Data sub shortcut
-           'hs':('('  ,') '),  #Header source
-           'dv':('{'  ,'} '),  #Header dataVariant
-           'sh':(''   ,''),    #Header shortcut
-           'pv':('/'  ,'/ '),  #Header plural variant
-           'ex':('('  ,') '),  #Header example
-           'sa':('`'  ,'`' ),  #Data sample
-           'sw':(''   ,''),    #Data sample wordclass; is no printed by Lingea (it is printed only in French?)
-           'do':('`'  ,'`' ),  #Data origin note
-           'df':(''   ,' '),   #Data definition
-           'nt':(''   ,' '),   #Data note
-           'ps':('"'  ,'" '),  #Data phrase short form
-           'pg':('"'  ,' = '), #Data phrase green
-           'pc':('`'  ,'`'),   #Data phrase comment; this comment is not printed by Lingea, but it seems useful
-           'p1':('"'  ,' = '), #Data phrase 1
-           'p2':(''   ,'" ' ), #Data phrase 2
-           'rs':('SYNONYM: ' ,'' ), #Reference synonym
-           'rr':('HYPERNYM: ','' ), #Reference hypernym
-           'rp':('HYPONYM: ' ,'' ), #Reference hyponym
-           'sp':('"'  ,' = ' ),#Data simple phrase
-           'b1':('"'  ,' = '), #Data phrase (block) 1
-           'b2':('" ' ,''),    #Data phrase (block) 2
-           }
-if OUTSTYLE == 1:
-    tag = {
-           'db':('•'       ,''),      #Data beginning
-           'rn':(''        ,'\t'),    #Record name
-           'va':(''        ,' '),     #Header variant
-           'wc':(''        ,'\\n'),   #WordClass
-           'pa':(''        ,':\\n'),  #Header parts
-           'fo':('('       ,') '),    #Header forms
-           'on':('('       ,')\\n' ), #Header origin note
-           'pr':('['       ,']\\n'),  #Header pronunciation; not printed by Lingea
-           'du':('('       ,')'),     #Data sub example
-           'dc':('('       ,')'),     #Data sub shortcut
-           'hs':('('       ,')\\n'),  #Header source
-           'dv':('{'       ,'} '),    #Header dataVariant
-           'sh':(''        ,'\\n'),   #Header shortcut
-           'pv':('/'       ,'/\\n'),  #Header plural variant
-           'ex':('('       ,')\\n'),  #Header example
-           'sa':('    '    ,'\\n' ),  #Data sample
-           'sw':(''        ,''),      #Data sample wordclass; is not printed by Lingea (it is printed in only in French?)
-           'do':('    '    ,' ' ),    #Data origin note
-           'df':('    '    ,'\\n'),   #Data definition
-           'nt':('    '    ,'\\n'),   #Data note
-           'ps':('    '    ,'\\n'),   #Data phrase short form
-           'pg':('    '    ,' '),     #Data phrase green
-           'pc':('    '    ,' '),     #Data phrase comment; this comment is not printed by Lingea, but it seems useful
-           'p1':('    '    ,' '),     #Data phrase 1
-           'p2':('      '  ,'\\n' ),  #Data phrase 2
-           'rs':('SYNONYM: ' ,'\\n' ),#Reference synonym
-           'rr':('HYPERNYM: ','\\n' ),#Reference hypernym
-           'rp':('HYPONYM: ' ,'\\n' ),#Reference hyponym
-           'sp':('    '    ,'\\n' ),  #Data simple phrase
-           'b1':('"'       ,' = '),   #Data phrase (block) 1
-           'b2':('" '      ,''),      #Data phrase (block) 2
-          }
-if OUTSTYLE == 2:
-    tag = {
-           'db':('•'                                                 ,''),              #Data beginning
-           'rn':(''                                                  ,'\t'),            #Record name
-           'va':(''                                                  ,' '),             #Header variant
-           'wc':('<span size="larger" color="darkred" weight="bold">','</span>\\n'),    #WordClass
-           'pa':('<span size="larger" color="darkred" weight="bold">',':</span>\\n'),   #Header parts
-           'fo':('('                                                 ,') '),            #Header forms
-           'on':('<span color="blue">('                              ,')</span>\\n' ),  #Header origin note
-           'pr':('['                                                 ,']\\n'),          #Header pronunciation; not printed by Lingea
-           'du':('('                                                 ,')'),             #Data sub example
-           'dc':('('                                                 ,')'),             #Data sub shortcut
-           'hs':('('                                                 ,')\\n'),          #Header source
-           'dv':('{'                                                 ,'} '),            #Header dataVariant
-           'sh':(''                                                  ,'\\n'),           #Header shortcut
-           'pv':('/'                                                 ,'/\\n'),          #Header plural variant
-           'ex':('('                                                 ,')\\n'),          #Header example
-           'sa':('    <span color="darkred" weight="bold">'          ,'</span>\\n' ),   #Data sample
-           'sw':(''                                                  ,''),              #Data sample wordclass; is not printed by Lingea (it is printed in only in French?)
-           'do':('    <span color="darkred" weight="bold">'          ,'</span> ' ),     #Data origin note
-           'df':('    <span weight="bold">'                          ,'</span>\\n'),    #Data definition
-           'nt':(''                                                  ,''),              #Data note
-           'ps':('    <span color="dimgray" weight="bold">'          ,'</span>\\n'),    #Data phrase short form
-           'pg':('    <span color="darkgreen" style="italic">'       ,'</span> '),      #Data phrase green
-           'pc':('    <span color="darkgreen" style="italic">'       ,'</span> '),      #Data phrase comment; this comment is not printed by Lingea, but it seems useful
-           'p1':('    <span color="dimgray" style="italic">'         ,'</span> '),      #Data phrase 1
-           'p2':('      '                                            ,'\\n' ),          #Data phrase 2
-           'rs':('SYNONYM: '                                         ,'\\n' ),          #Reference synonym
-           'rr':('HYPERNYM: '                                        ,'\\n' ),          #Reference hypernym
-           'rp':('HYPONYM: '                                         ,'\\n' ),          #Reference hyponym
-           'sp':('    <span color="cyan">'                           ,'</span>\\n' ),   #Data simple phrase
-           'b1':('"'                                                 ,' = '),           #Data phrase (block) 1
-           'b2':('" '                                                ,''),              #Data phrase (block) 2
-          }
-
-
-
-# Print color debug functions
-purple = lambda c: '\x1b[1;35m'+c+'\x1b[0m'
-blue = lambda c: '\x1b[1;34m'+c+'\x1b[0m'
-cyan = lambda c: '\x1b[36m'+c+'\x1b[0m'
-gray = lambda c: '\x1b[1m'+c+'\x1b[0m'
-
-def getRec(n):
-    """Get data stream for record of given number"""
-    if n >= 0 and n < entryCount:
-        f.seek(index[n])
-        return f.read(index[n+1] - index[n])
-    else:
-        return ''
-
-def decode_alpha( stream, nullstop=True):
-    """Decode 6-bit encoding data stream from the beginning until first NULL"""
-    offset = 0
-    triple = 0
-    result = []
-    while triple < len( stream ):
-        if offset % 4 == 0:
-            c = stream[triple] >> 2
-            triple += 1
-        if offset % 4 == 1:
-            c = (stream[triple-1] & 3) << 4 | stream[triple] >> 4
-            triple += 1
-        if offset % 4 == 2:
-            c = (stream[triple-1] & 15) << 2 | (stream[triple] & 192) >> 6
-            triple += 1
-        if offset % 4 == 3:
-            c = stream[triple-1] & 63
-        if c == 0 and nullstop:
-            break
-        offset += 1
-        # TODO: ENCODE UNICODE 4 BYTE STREAM!!! and but it after #UNICODE# as unichr()
-        result.append(c)
-    return decode_alpha_postprocessing(result), triple - 1
-
-
-def decode_alpha_postprocessing( input ):
-    """Lowlevel alphabet decoding postprocessing, combines tuples into one character"""
-    result = ""
-    input.extend([0x00]*5)
-
-    # UPCASE, UPCASE_PRON, SYMBOL, SPECIAL
-    skip = False
-    for i in range(0,len(input)-1):
-        if skip > 0:
-            skip -= 1
-            continue
-
-        bc = input[i]
-        c = alpha[bc]
-        bc1 = input[i+1]
-        c1 = alpha[bc1]
-        if c[0] == '#':
-           skip = 1
-           if c in subs:
-              if c in ("#UPCASE#", "#SPECIAL#", "#SYMBOL#"):
-                 result += subs[c][bc1]
-              elif c in ("#PRON#"):
-                 bc2 = input[i+2]
-                 c2 = alpha[bc2]
-                 cc = c1 + c2
-                 if cc in subs[c]:
-                    result += subs[c][cc]
-                 else:
-                    result += c + cc # debug
-                 skip = 2
-              elif c1 in subs[c]:
-                 result += subs[c][c1]
-              else:
-                 result += c + c1 # debug
-           else:
-              result += c # debug
-        else:
-           result += c
-
-    return result
-
-def pronunciation_encode(s):
-    """Encode pronunciation upcase symbols into IPA symbols"""
-    for i in range(0, 64):
-        s = s.replace(upcase[i], upcase_pron[i])
-    return s
-
-re_a = re.compile(r'<a(.*?)>') 
-re_c = re.compile(r'<c(.*?)>')
-re_d = re.compile(r'<d(.*?)>')
-re_e = re.compile(r'<e(.*?)>')
-re_E = re.compile(r'<E(.*?)>')
-re_f = re.compile(r'<f(.*?)>')
-re_g = re.compile(r'<g(.*?)>') #language
-re_h = re.compile(r'<h(.*?)>')
-re_i = re.compile(r'<i(.*?)>') 
-re_I = re.compile(r'<I(.*?)>') 
-re_l = re.compile(r'<l(.*?)>') 
-re_L = re.compile(r'<L(.*?)>') 
-re_n = re.compile(r'<n(.*?)>') 
-re_N = re.compile(r'<N(.*?)>') 
-re_o = re.compile(r'<o(.*?)>') 
-re_p = re.compile(r'<p(.*?)>') 
-re_q = re.compile(r'<q(.*?)>') 
-re_r = re.compile(r'<r(.*?)>') 
-re_t = re.compile(r'<t(.*?)>') 
-re_u = re.compile(r'<u(.*?)>') 
-re_v = re.compile(r'<v(.*?)>') 
-re_w = re.compile(r'<w(.*?)>')
-re_x = re.compile(r'<x(.*?)>')
-re_y = re.compile(r'<y(.*?)>')
-re_z = re.compile(r'<z(.*?)>')
-re__ = re.compile(r'<\^(.*?)>')
-
-def decode_tag_postprocessing(input):
-    """Decode and replace tags used in Lingea dictionaries; decode internal tags"""
-    s = input
-
-    # General information in http://www.david-zbiral.cz/El-slovniky-plnaverze.htm#_Toc151656799
-    # TODO: Better output handling
-
-    if (OUTSTYLE == 0) or (OUTSTYLE == 1):
-        s = re_a.sub(r'(\1)',s)
-        s = re_c.sub(r'(\1)',s)
-        s = re_d.sub(r'(\1)',s)
-        s = re_e.sub(r'(\1)',s)
-        s = re_E.sub(r'(\1)',s)
-        s = re_f.sub(r'(\1)',s)
-        s = re_g.sub(r'(\1)',s)
-        s = re_h.sub(r'(\1)',s)
-        s = re_i.sub(r'(\1)',s)
-        s = re_I.sub(r'(\1)',s)
-        s = re_l.sub(r'(\1)',s)
-        s = re_L.sub(r'(\1)',s)
-        s = re_n.sub(r'(\1)',s)
-        s = re_N.sub(r'(\1)',s)
-        s = re_o.sub(r'(\1)',s)
-        s = re_p.sub(r'(\1)',s)
-        s = re_q.sub(r'(\1)',s)
-        s = re_r.sub(r'(\1)',s)
-        s = re_t.sub(r'(\1)',s)
-        s = re_u.sub(r'(\1)',s)
-        s = re_v.sub(r'(\1)',s)
-        s = re_w.sub(r'(\1)',s)
-        s = re_x.sub(r'(\1)',s)
-        s = re_y.sub(r'(\1)',s)
-        s = re_z.sub(r'(\1)',s)
-        s = re__.sub(r'(\1)',s)
-    if OUTSTYLE == 2:
-        s = re_a.sub(r'<span size="small" color="blue" style="italic">\1</span>',s)
-        s = re_c.sub(r'<span size="small" color="blue" style="italic">\1</span>',s)
-        s = re_d.sub(r'<span size="small" color="blue">(\1)</span>',s)
-        s = re_e.sub(r'<span size="small" color="blue" style="italic">\1</span>',s)
-        s = re_E.sub(r'<span size="small" color="blue" style="italic">\1</span>',s)
-        s = re_f.sub(r'<span size="small" color="blue" style="italic">\1</span>',s)
-        s = re_g.sub(r'<span size="small" color="blue" style="italic">\1</span>',s)
-        s = re_h.sub(r'<span size="small" color="blue" style="italic">\1</span>',s)
-        s = re_i.sub(r'<span size="small" color="blue" style="italic">\1</span>',s)
-        s = re_I.sub(r'<span size="small" color="blue" style="italic">\1</span>',s)
-        s = re_l.sub(r'<span size="small" color="blue" style="italic">\1</span>',s)
-        s = re_L.sub(r'<span size="small" color="blue" style="italic">\1</span>',s)
-        s = re_n.sub(r'<span size="small" color="blue" style="italic">\1</span>',s)
-        s = re_N.sub(r'<span size="small" color="blue" style="italic">\1</span>',s)
-        s = re_o.sub(r'<span size="small" color="blue" style="italic">\1</span>',s)
-        s = re_p.sub(r'<span size="small" color="blue" style="italic">\1</span>',s)
-        s = re_q.sub(r'<span size="small" color="blue" style="italic">\1</span>',s)
-        s = re_r.sub(r'<span size="small" color="blue" style="italic">\1</span>',s)
-        s = re_t.sub(r'<span size="small" color="blue" style="italic">\1</span>',s)
-        s = re_u.sub(r'<span size="small" color="blue" style="italic">\1</span>',s)
-        s = re_v.sub(r'<span size="small" color="blue" style="italic">\1</span>',s)
-        s = re_w.sub(r'<span size="small" color="blue" style="italic">\1</span>',s)
-        s = re_x.sub(r'<span size="small" color="brown" style="italic">\1</span>',s)
-        s = re_y.sub(r'<span size="small" color="blue" style="italic">\1</span>',s)
-        s = re_z.sub(r'<span size="small" color="blue" style="italic">\1</span>',s)
-        s = re__.sub(r'<span size="small" color="blue" style="italic">\1</span>',s)
-
-    return s
-
-def toBin( b ):
-    """Prettify debug output format: hex(bin)dec"""
-    original = b
-    r = 0;
-    i = 1;
-    while b > 0:
-        if b & 0x01 != 0: r += i
-        i *= 10
-        b = b >> 1
-    return "0x%02X(%08d)%03d" % (original, r, original)
-
-
-def outInt( comment = "" ):
-    """Read next byte and output DEBUG info"""
-    global bs, pos
-
-    if DEBUG: print "%03d %s %s | %03d" % (pos, toBin(bs[pos]),comment, pos)
-    if (comment.find('%') != -1):
-         comment = comment % bs[pos]
-    pos += 1
-    return bs[pos-1]
-
-def outStr( comment = "" ):
-    """Read next string and output DEBUG info"""
-    global bs, pos
-
-    s, triple  = decode_alpha(bs[pos:])
-    s = s.split('\x00')[0] # give me string until first NULL
-    if (comment.find('%') != -1):
-        comment = comment % s
-    if DEBUG: print "%03d %s %s | %s" % (pos, toBin(bs[pos]),comment, s)
-    pos += triple + 1
-    return s.replace('`','') # Remove '`' character from words
-
-def decode(stream):
-    """Decode byte stream of one record, return decoded string with formatting in utf"""
-    result = ""
-    global bs, pos
-    # stream - data byte stream for one record
-    bs = unpack("<%sB" % len(stream), stream)
-    # bs - list of bytes from stream
-
-    pos = 0
-    itemCount = outInt("ItemCount: %s") # Number of blocks in the record
-    mainFlag = outInt("MainFlag: %s")
-
-    # HEADER BLOCK
-    # ------------
-    if mainFlag & 0x01:
-        headerFlag = outInt("HeaderFlag: %s") # Blocks in header
-        if headerFlag & 0x01:
-            result += tag['rn'][0] + outStr("Header record name: %s").replace('_','') + tag['rn'][1]  # Remove character '_' from index
-        if headerFlag & 0x02:
-            result += tag['va'][0] + outStr("Header variant: %s") + tag['va'][1]
-        if headerFlag & 0x04:
-            s = outInt("Header wordclass: %s")
-            if s < 32:
-                result += tag['wc'][0] + wordclass[s] + tag['wc'][1]
-            else:
-                raise "Header wordclass out of range in: %s" % result
-        if headerFlag & 0x08:
-            result += tag['pa'][0] + outStr("Header parts: %s") + tag['pa'][1]
-        if headerFlag & 0x10:
-            result += tag['fo'][0] + outStr("Header forms: %s") + tag['fo'][1]
-        if headerFlag & 0x20:
-            result += tag['on'][0] + outStr("Header origin note: %s") +  tag['on'][1]
-        if headerFlag & 0x80:
-            result += tag['pr'][0] + pronunciation_encode(outStr("Header pronunciation: %s")) + tag['pr'][1]
-    
-    # Header data block
-    if mainFlag & 0x02:
-        headerFlag = outInt("Header headerFlag: %s") # Blocks in header
-        if headerFlag & 0x01:
-            result += tag['hs'][0] + outStr("Header source: %s")+ tag['hs'][1]
-        if headerFlag & 0x02:
-            result += tag['dv'][0] + outStr("Header dataVariant: %s")+ tag['dv'][1]
-        if headerFlag & 0x08:
-            result += tag['ex'][0] + outStr("Example: %s") + tag['ex'][1]
-        if headerFlag & 0x10:
-            result += tag['sh'][0] + outStr("Header shortcut: %s") + tag['sh'][1]
-        if headerFlag & 0x40:
-            result += tag['pv'][0] + outStr("Plural variant: %s") + tag['pv'][1]
-
-    # ??? Link elsewhere
-    pass
-
-    # SOUND DATA REFERENCE
-    if mainFlag & 0x80:
-       outInt("Sound reference byte #1: %s")
-       outInt("Sound reference byte #2: %s")
-       outInt("Sound reference byte #3: %s")
-       outInt("Sound reference byte #4: %s")
-       if outInt("Sound reference continue: %s") & 0x80:
-          outInt("Sound reference byte #5: %s")
-          outInt("Sound reference byte #6: %s")
-          outInt("Sound reference byte #7: %s")
-          outInt("Sound reference byte #8: %s")
-
-    # TODO: Test all mainFlags in header!!!!
-
-    #result += ': '
-    li = 0
- 
-    #print just every first word class identifier
-    # TODO: this is not systematic (should be handled by output)
-    global lastWordClass
-    lastWordClass = 0
-
-    # DATA BLOCK(S)
-    # -------------
-    for i in range(0, itemCount):
-        item = tag['db'][0] + tag['db'][1]
-        ol = False
-        dataFlag = outInt("DataFlag #%i: %%s -----------------------------" % i)
-        if dataFlag & 0x01: # small index
-            sampleFlag = outInt("Data sampleFlag: %s")
-            if sampleFlag & 0x01:
-                result += tag['sa'][0] + outStr("Data sample: %s") +  tag['sa'][1]
-            if sampleFlag & 0x02:
-                result += tag['sa'][0] + outStr("Data sample variant: %s") +  tag['sa'][1]
-            if sampleFlag & 0x04:
-               s = outInt("Data wordclass: %s")
-               if s != lastWordClass: 
-                  if s < 32:
-                      result += tag['wc'][0] + wordclass[s] + tag['wc'][1]
-                  else:
-                      raise "Header wordclass out of range in: %s" % result
-               lastWordClass = s
-            if sampleFlag & 0x08:
-                result += tag['sw'][0] + outStr("Data sample wordclass: %s") + tag['sw'][1]
-            if sampleFlag & 0x10:
-                outInt("Data sample Int: %s")
-                outInt("Data sample Int: %s")
-                outInt("Data sample Int: %s")
-            if sampleFlag & 0x20:
-                item += tag['do'][0] + outStr("Data origin note: %s") + tag['do'][1]
-            if sampleFlag & 0x80:
-                item += "    "
-                result += tag['pr'][0] + pronunciation_encode(outStr("Data sample pronunciation: %s")) + tag['pr'][1]
-        if dataFlag & 0x02:
-            item += "    "
-            subFlag = outInt("Data subFlag: %s")
-            if subFlag & 0x08:
-                item += tag['du'][0] + outStr("Data sub example: %s") + tag['du'][1]
-            if subFlag & 0x10:
-                item += tag['dc'][0] + outStr("Data sub shortcut: %s") + tag['dc'][1]
-            if subFlag & 0x80:
-                outStr("Data sub prefix: %s")
-                # It seams that data sub prefix content is ignored and there is a generated number for the whole block instead.
-                li += 1
-                ol = True
-        if dataFlag & 0x04: # chart
-            pass # ???
-        if dataFlag & 0x08: # reference
-            item += tag['df'][0] + outStr("Data definition: %s") + tag['df'][1]
-        if dataFlag & 0x10: # note???
-            noteFlag = outInt("Data noteFlag: %s");
-            if noteFlag & 0x01:
-                item += tag['nt'][0] + outStr("Data note 0x01: %s") + tag['nt'][1]
-            if noteFlag & 0x02:
-                noteCount = outInt("Data noteCount: %s")
-                for i in range(0, noteCount):
-                   item += tag['nt'][0] + outStr("Data note 0x02: %s") + tag['nt'][1]
-            if noteFlag & 0x08:
-                noteCount = outInt("Data noteCount: %s")
-                for i in range(0, noteCount):
-                   item += tag['nt'][0] + outStr("Data note 0x08: %s") + tag['nt'][1]
-            if noteFlag & 0x40:
-                item += tag['nt'][0] + outStr("Data note 0x40: %s") + tag['nt'][1]
-        if dataFlag & 0x20: # phrase
-            phraseFlag1 = outInt("Data phraseFlag1: %s")
-            if phraseFlag1 & 0x01:
-                item += tag['ps'][0] + outStr("Data phrase short form: %s") + tag['ps'][1]
-            if phraseFlag1 & 0x02:
-                phraseCount = outInt("Data phraseCount: %s")
-                for i in range(0, phraseCount):
-                    phraseComment = outInt("Data phrase prefix")
-                    if phraseComment & 0x04:
-                       item += tag['pc'][0] + outStr("Data phrase comment: %s")  + tag['pc'][1]
-                    item += tag['p1'][0] + outStr("Data phrase 1: %s") + tag['p1'][1]
-                    item += tag['p2'][0] + outStr("Data phrase 2: %s") + tag['p2'][1]
-            if phraseFlag1 & 0x04:
-                phraseCount = outInt("Data phraseCount: %s")
-                for i in range(0, phraseCount):
-                    phraseComment = outInt("Data phrase prefix")
-                    if phraseComment & 0x04:
-                       item += tag['pc'][0] + outStr("Data phrase 1: %s")  + tag['pc'][1]
-                    item += tag['pg'][0] + outStr("Data phrase comment: %s")  + tag['pg'][1]
-                    item += tag['p2'][0] + outStr("Data phrase 2: %s") +  tag['p2'][1]
-            if phraseFlag1 & 0x08:
-                phraseCount = outInt("Data simple phraseCount: %s")
-                for i in range(0, phraseCount):
-                    item += tag['sp'][0] + outStr("Data simple phrase: %s") +  tag['sp'][1]
-            if phraseFlag1 & 0x10:
-                if smallIndex: # different behaviour in small and big dictionaries
-                   item += tag['ps'][0] + outStr("Data phrase short form: %s") + tag['ps'][1]
-                else:
-                   phraseCount = outInt("Data phraseCount: %s")
-                   for i in range(0, phraseCount):
-                      item += tag['ps'][0] + outStr("Data phrase short form: %s") + tag['ps'][1]
-            if phraseFlag1 & 0x40:
-                item += tag['ps'][0] + outStr("Data phrase short form: %s") + tag['ps'][1]
-
-
-            # TODO: be careful in changing the rules, to have back compatibility! 
-        if dataFlag & 0x40: # reference, related language
-            referenceFlag = outInt("Data referenceFlag: %s")
-            if referenceFlag & 0x01:
-                item += tag['rs'][0] + outStr("Reference synonym: %s") + tag['rs'][1]
-            if referenceFlag & 0x04: # lg_en-wn
-                item += tag['rr'][0] + outStr("Reference hypernym: %s") + tag['rr'][1]
-            if referenceFlag & 0x08: # lg_en-wn
-                item += tag['rp'][0] + outStr("Reference hyponym: %s") + tag['rp'][1]
-            #0x02 antonym ?
-        if dataFlag & 0x80: # Phrase block
-            flags = [
-            out("Data phrase block: %s"),
-            out("Data phrase block: %s"),
-            out("Data phrase block: %s"),
-            out("Data phrase block: %s"),
-            out("Data phrase block: %s"),
-            out("Data phrase block: %s"),
-            out("Data phrase block: %s"),
-            out("Data phrase block: %s")]
-            if flags == [0x80,0x80,0xF9,0xDF,0x9D,0x00,0x0B,0x01]:
-                result += "\\nphr: "
-                li = 1
-                ol = True
-                item += tag['b1'][0]+outStr("Data phrase 1: %s") + tag['b1'][1]
-                out("Data phrase block: %s")
-                out("Data phrase block: %s")
-                out("Data phrase block: %s")
-                out("Data phrase block: %s")
-                item += tag['ds'][0] + outStr("Data phrase 2: %s") + tag['ds'][1]
-            if flags == [0x80,0x80,0xF9,0xDF,0x9D,0x00,0x23,0x01]:
-                result += "\\nphr: "
-                li = 1
-                ol = True
-                item += tag['b1'][0]+outStr("Data phrase 1: %s") + tag['b1'][1]
-                out("Data phrase block: %s")
-                out("Data phrase block: %s")
-                out("Data phrase block: %s")
-                out("Data phrase block: %s")
-                out("Data phrase block: %s")
-                item += tag['ds'][0] + outStr("Data phrase 2: %s") + tag['ds'][1]
-        if ol:
-            result += "\\n%d. %s" % (li, item)
-        else:
-            result += item
+# Modes of the script, at most one of them can be chosen
+modes = [(LOOKUP is not None, "-w/-p"), (HEADWORDS, "-n"), (STARDICT is not None, "-s"), (COLUMNS is not None, "-x"),
+         (DEBUG, "-d"), (FORMATS is not None, "-m"), (UPDATE, "-u"), (BATCH is not None, "-b"), (VALIDATE is not None, "-v")]
+MODES = [name for chosen, name in modes if chosen]
+if len(MODES) > 1:
+   usage()
+   print "ERROR: Options %s can not be used together" % ", ".join(MODES)
+   sys.exit(2)
 
-    ok = True
-    if (len(stream) != 13752) and (len(stream) != 21988) and (len(stream) != 16204) and (len(stream) != 12656): #hack to workaround bug in some dicts (lg_czen-eco, lg_encz-ind, lg_czgr-eco, lg_grsk-2)
-       while pos < len(stream):
-           ok = (outInt() == 0x00) and ok
+if OUTPUT is not None and MODES and MODES[0] in ("-s", "-x", "-d", "-b", "-v"):
+   usage()
+   print "ERROR: Option -f can not be used with %s" % MODES[0]
+   sys.exit(2)
 
-    if ok:
-        result += '\n'
+if DICTZIP and STARDICT is None:
+   usage()
+   print "ERROR: Option -z needs StarDict dictionary given by -s"
+   sys.exit(2)
 
-    return decode_tag_postprocessing(result)
+if SORTED and COLUMNS is None:
+   usage()
+   print "ERROR: Option --sorted needs columnar file given by -x"
+   sys.exit(2)
 
-################################################################
-# MAIN
-################################################################
+if UPDATE and OUTPUT is None:
+   usage()
+   print "ERROR: Output file has to be specified by -f for update"
+   sys.exit(2)
 
+if FORMATS and OUTPUT is None:
+   usage()
+   print "ERROR: Base name of output files has to be specified by -f for formats"
+   sys.exit(2)
 
-f = open(FILENAME,'rb')
+from lingea_trd import *
+import multiprocessing, traceback, collections
+import os, time, mmap, json
 
-# DECODE HEADER OF FILE
+# Number of records decoded by one task of worker process
+CHUNKSIZE = 500
 
-copyright = unpack("<64s",f.read(64))[0]
-a = unpack("<16L",f.read(64))
+def decode_records(chunk):
+    """Decode records in range (first, last) until the first wrong one, return decoded strings and error traceback"""
+    first, last = chunk
+    result = []
+    try:
+        for i in range(first, last):
+            s = decode(dictionary.reader(dictionary.getRec(i), dictionary), dictionary)
+            result.append(s)
+            if not s.endswith('\n'):
+                break
+    except Exception:
+        return result, traceback.format_exc()
+    return result, None
+
+def validate_records(chunk):
+    """Decode records in range (first, last), return (number, decoded string, failure) of wrong records
+
+    Failure is (offset of record, position where decoding diverged, length of record, exception or None).
+    With DEBUGHEADER or DEBUGALL all records are returned, failure of correct ones is None."""
+    first, last = chunk
+    result = []
+    for i in range(first, last):
+        reader = dictionary.reader(dictionary.getRec(i), dictionary)
+        try:
+            record = parse(reader, dictionary)
+        except Exception, e:
+            result.append((i, "", (dictionary.index[i], reader.pos, len(reader.bs), repr(e))))
+            continue
+        if not record.complete:
+            result.append((i, render_text(record, dictionary.outStyle), (dictionary.index[i], record.end, len(reader.bs), None)))
+        elif DEBUGHEADER or DEBUGALL:
+            result.append((i, render_text(record, dictionary.outStyle), None))
+    return result
 
-entryCount = a[4]
-indexBaseCount = a[6]
-indexOffsetCount = a[7]
-pos1 = a[8]
-indexPos = a[9]
-bodyPos = a[10]
-smallIndex = (a[3] == 2052)
+def trace_record(i):
+    """Decode record and print every read value, return decoded string or traceback of exception"""
+    try:
+        return decode(TracingReader(dictionary.getRec(i), dictionary), dictionary)
+    except Exception:
+        return traceback.format_exc()
+
+# File extensions of output formats
+formatExtensions = {0: '.txt', 1: '.tab', 2: '.htm', 'json': '.json'}
+
+def render_records(chunk):
+    """Decode records in range (first, last) once and format them in all FORMATS until the first wrong one
+
+    Return list of formatted strings for every format, number of the wrong record (None if all records
+    are complete) and error traceback"""
+    first, last = chunk
+    result = [[] for f in FORMATS]
+    try:
+        for i in range(first, last):
+            record = parse(dictionary.reader(dictionary.getRec(i), dictionary), dictionary)
+            for strings, f in zip(result, FORMATS):
+                strings.append(renderers[f](record))
+            if not record.complete:
+                return result, i, None
+    except Exception:
+        return result, None, traceback.format_exc()
+    return result, None, None
+
+def ordered_chunks(function, chunks):
+    """Decode chunks of records by function, yield results in original order
+
+    With JOBS > 1 chunks are decoded in worker pool, at most 2 * JOBS chunks in progress. When the
+    generator is exhausted or closed, the pool is closed and joined: chunks in progress are finished,
+    terminate() can deadlock with their results in the queue."""
+    if JOBS <= 1:
+        for chunk in chunks:
+            yield function(chunk)
+        return
+    # workers share the memory mapped file
+    pool = multiprocessing.Pool(JOBS)
+    try:
+        pending = collections.deque()
+        for chunk in chunks:
+            pending.append(pool.apply_async(function, (chunk,)))
+            if len(pending) >= 2 * JOBS:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        pool.close()
+        pool.join()
+
+STRUCTUREERROR = "RECORD STRUCTURE DECODING ERROR"
+
+def print_structure_error(out):
+    """Write message about record not matching known structure of records after the record"""
+    out.write("\n!!! %s !!!\n" % STRUCTUREERROR)
+    out.write("Please run this script in DEBUG mode and repair DATA BLOCK(S) section in function decode()\n")
+    out.write("If you succeed with whole dictionary send report (name of the dictionary and source code of script) to slovniky@googlegroups.com\n")
+
+def print_records(chunks, out):
+    """Write decoded chunks of records in format for stardict-editor <term>\t<definition>, stop at the first wrong record
+
+    Return number of written records and None, STRUCTUREERROR or traceback of exception which stopped decoding."""
+    count = 0
+    for strings, error in chunks:
+        out.writelines(strings)
+        count += len(strings)
+        if strings and not strings[-1].endswith('\n'):
+            print_structure_error(out)
+            return count - 1, STRUCTUREERROR
+        if error:
+            return count, error
+    return count, None
+
+def updated_chunks(previous, hashes, records):
+    """Generate chunks of single records for print_records(), records with known hash are copied from previous output
+
+    Hashes and positions of written records are appended to records."""
+    pos = 0
+    for i in range(1, dictionary.entryCount):
+        h = record_hash(dictionary.getRec(i))
+        if h in hashes:
+            offset, length = hashes[h]
+            strings, error = [previous[offset:offset + length]], None
+        else:
+            strings, error = decode_records((i, i + 1))
+        for s in strings:
+            if s.endswith('\n'):
+                records.append((h, pos, len(s)))
+                pos += len(s)
+        yield strings, error
+
+def update_output(outPath):
+    """Write records to output file, decode just records not found by hash in the previous output
+
+    Return number of written records, error as print_records() and number of records copied from the previous output."""
+    hashes = None
+    if os.path.exists(outPath):
+        hashes = read_record_hashes(outPath + '.rh', dictionary.outStyle, dictionary.smallIndex, os.stat(outPath))
+    previous = ''
+    if hashes:
+        f = open(outPath, 'rb')
+        previous = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        f.close()
+    else:
+        hashes = {}
+    records = []
+    out = OutputBuffer(open(outPath + '.part', 'wb'))
+    count, error = print_records(updated_chunks(previous, hashes, records), out)
+    out.close()
+    if error not in (None, STRUCTUREERROR):
+        return count, error, 0
+    os.rename(outPath + '.part', outPath)
+    write_record_hashes(outPath + '.rh', dictionary.outStyle, dictionary.smallIndex, os.stat(outPath), records)
+    return count, error, sum(1 for h, pos, length in records if h in hashes)
+
+def open_output():
+    """Buffer of output file given by -f, standard output without it"""
+    if OUTPUT is None:
+        return OutputBuffer(sys.stdout)
+    return OutputBuffer(open(OUTPUT, 'wb'))
+
+def record_chunks(entryCount):
+    """Split records 1 .. entryCount-1 to chunks (first, last) for decode_records()"""
+    return [(i, min(i + CHUNKSIZE, entryCount)) for i in range(1, entryCount, CHUNKSIZE)]
+
+def convert_file(job):
+    """Convert dictionary file to tab file in batch mode, return path, number of records, seconds and error"""
+    global dictionary
+    path, outPath = job
+    start = time.time()
+    try:
+        dictionary = Dictionary(path, OUTSTYLE, INDEXCACHE)
+        if not os.path.isdir(os.path.dirname(outPath)):
+            try:
+                os.makedirs(os.path.dirname(outPath))
+            except OSError:
+                pass # created by another worker
+        out = OutputBuffer(open(outPath + '.part', 'wb'))
+        count, error = print_records((decode_records(chunk) for chunk in record_chunks(dictionary.entryCount)), out)
+        out.close()
+    except Exception:
+        count, error = 0, traceback.format_exc()
+    if error is None:
+        # unfinished output is left in .part file, so it is never taken for up to date
+        os.rename(outPath + '.part', outPath)
+    return path, count, time.time() - start, error
+
+def find_dictionaries(directory):
+    """Find .trd files in directory and its subdirectories, largest first"""
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        for name in files:
+            if name.endswith('.trd'):
+                path = os.path.join(root, name)
+                paths.append((os.path.getsize(path), path))
+    paths.sort(reverse=True)
+    return [path for size, path in paths]
+
+def batch_jobs(directory, outDirectory):
+    """Find dictionaries to convert, largest first, skip the ones with output newer than the dictionary
+
+    Output keeps the path of the dictionary relative to directory, extension is given by output style."""
+    jobs = []
+    skipped = []
+    for path in find_dictionaries(directory):
+        outPath = os.path.join(outDirectory, os.path.relpath(path, directory)[:-len('.trd')] + formatExtensions[OUTSTYLE])
+        if os.path.exists(outPath):
+            outStat = os.stat(outPath)
+            if outStat.st_size > 0 and outStat.st_mtime >= os.path.getmtime(path):
+                skipped.append(path)
+                continue
+        jobs.append((path, outPath))
+    return jobs, skipped
+
+def validate_file(path):
+    """Decode all records of dictionary file, return report of wrong records, unknown symbols and unhandled flag bits"""
+    start = time.time()
+    report = {'file': path, 'size': os.path.getsize(path), 'records': 0, 'wrong': 0, 'errors': 0,
+              'wrongRecords': [], 'unknownSymbols': {}, 'unhandledFlags': {}}
+    try:
+        dictionary = Dictionary(path, OUTSTYLE, INDEXCACHE)
+        report['records'] = dictionary.entryCount - 1
+        symbols = collections.defaultdict(int)
+        unhandled = {}
+        for i in range(1, dictionary.entryCount):
+            try:
+                record = parse(FlagReader(dictionary.getRec(i), dictionary, unhandled), dictionary)
+            except Exception, e:
+                report['errors'] += 1
+                report['wrongRecords'].append([i, repr(e)])
+                continue
+            if not record.complete:
+                report['wrong'] += 1
+                report['wrongRecords'].append([i, STRUCTUREERROR])
+                continue
+            for text in record_texts(record):
+                if '#' in text:
+                    for symbol in re_placeholder.findall(text):
+                        symbols[symbol] += 1
+        report['unknownSymbols'] = dict(symbols)
+        report['unhandledFlags'] = dict([(name, bit_histogram(counts)) for name, counts in unhandled.items()])
+    except Exception:
+        report['errors'] += 1
+        report['wrongRecords'].append([0, traceback.format_exc()])
+    del report['wrongRecords'][VALIDATEWRONGLIMIT:]
+    report['seconds'] = time.time() - start
+    return report
+
+# Number of wrong records listed in validation report of every dictionary
+VALIDATEWRONGLIMIT = 100
+
+def print_batch_summary(directory, results, skipped, seconds):
+    """Print table of converted dictionaries (paths relative to directory) with throughput"""
+    print "%-32s %10s %9s %8s %10s %8s  %s" % ("dictionary", "records", "MB", "s", "rec/s", "MB/s", "status")
+    totalRecords = 0
+    totalSize = 0
+    failed = 0
+    for path, count, elapsed, error in results:
+        size = os.path.getsize(path) / 1048576.0
+        totalRecords += count
+        totalSize += size
+        if error is None:
+            status = "ok"
+        elif error == STRUCTUREERROR:
+            status = STRUCTUREERROR.lower()
+        else:
+            status = "error: " + error.strip().splitlines()[-1]
+        if error is not None:
+            failed += 1
+        elapsed = max(elapsed, 1e-6)
+        print "%-32s %10d %9.2f %8.2f %10.0f %8.2f  %s" % (os.path.relpath(path, directory), count, size, elapsed, count / elapsed, size / elapsed, status)
+    for path in skipped:
+        print "%-32s %10s %9.2f %8s %10s %8s  %s" % (os.path.relpath(path, directory), "", os.path.getsize(path) / 1048576.0, "", "", "", "up to date")
+    seconds = max(seconds, 1e-6)
+    print "%-32s %10d %9.2f %8.2f %10.0f %8.2f  %s converted, %s skipped, %s failed" % ("total", totalRecords, totalSize, seconds,
+        totalRecords / seconds, totalSize / seconds, len(results) - failed, len(skipped), failed)
+    return failed
 
 ################################################################
-# TRANSLATION TABLES
+# MAIN
 ################################################################
 
-if smallIndex: # TODO: smallIndex might not correspond with encoding
-   alpha = ['\x00', 'a','b','c','d','e','f','g','h','i',
-       'j','k','l','m','n','o','p','q','r','s',
-       't','u','v','w','x','y','z','á','ä','č',
-       'ď','é', 'ě', 'í', '#AL34#', '#AL35#', 'ň', 'ó', 'ö', '#AL39#',
-       'ř', 'š', 'ť', 'ú', 'ů', 'ü', 'ý', 'ž', 'ß', ' ',
-       '.', ',', '-', '\'', '(', ')', '`', '"', '#AL58#', '#AL59#',
-       '#UPCASE#', 'à', '#SPECIAL#', "#AL1234213"] # 4 bytes after unicode
-
-   upcase = ['\x00', 'A','B','C','D','E','F','G','H','I',
-       'J','K','L','M','N','O','P','Q','R','S',
-       'T','U','V','W','X','Y','Z','Á','Ä','Č',
-       'Ď','É', 'Ě', 'Í', '<', '>', 'Ň', 'Ó', '-', '#UP39#',
-       'Ř', 'Š', 'Ť', 'Ú', 'Ů', 'Ü', 'Ý', 'Ž', '#UP48#', ' ',
-       '#UP.#', '#UP,#', '#UP-#', '#UP\'#', '#UP(#', '#UP)#', '#UP`#', '#UP"#', '#UP58#', '#UP59#',
-       '#~UPCASE#', 'À', '#UP/#'] # 4 bytes after unicode
-else:
-   alpha = ['\x00', 'a','b','c','d','e','f','g','h','i',
-       'j','k','l','m','n','o','p','q','r','s',
-       't','u','v','w','x','y','z','#AL27#','#AL28#','#AL29#',
-       '#AL30#','#AL31#', ' ', '.', '<', '>', ',', ';', '-', '#AL39#',
-       '#GRAVE#', '#ACUTE#', '#CIRC#', '#TILDE#', '#UML#', '#AL45#', '#DACUT#', '#CARON#', '#BREVE#', '#CEDIL#',
-       '#STROKE#', '#SHARP#', 'β', '#AL53#', '#AL54#', '#AL55#', '#AL56#', '#AL57#', 's', '#SYMBOL#', # symbol 58 is used in Spanish word pillo as s (seimpre)
-       '#PRON#', '#UPCASE#', '#SPECIAL#', '#UNICODE#'] # 4 bytes after unicode
-
-   upcase = ['#UP0#','#UP1#','#UP2#','#UP3#','#UP4#','#UP5#','#UP6#','#UP7#','#UP8#','#UP9#',
-       '#UP10#','#UP11#','#UP12#','#UP13#','#UP14#','#UP15#','#UP16#','#UP17#','#UP18#','#UP19#',
-       '#UP20#','#UP21#','#UP22#','#UP23#','#UP24#','#UP25#','#UP26#','#UP27#','#UP28#','#UP29#',
-       '#UP30#','#UP31#','A','B','C','D','E','F','G','H',
-       'I','J','K','L','M','N','O','P','Q','R',
-       'S','T','U','V','W','X','Y','Z','#UP58#','#UP59#',
-       '#UP60#','#UP61#','#UP62#','#UP63#']
-
-upcase_pron = ['#upr0#', '#upr1#','#upr2#','#upr3#','#upr4#','#upr5#','#upr6#','#upr7#','#upr8#','#upr9#',
-    '#upr10#', '#upr11#','#upr12#','#upr13#','#upr14#','#upr15#','#upr16#','#upr17#','#upr18#','#upr19#',
-    '#upr20#', '#upr21#','#upr22#','#upr23#','#upr24#','#upr25#','#upr26#','#upr27#','#upr28#','#upr29#',
-    '#upr30#', '#upr31#','ɑ','#upr33#','ʧ','ð','ə','ɜ','#upr38#','æ',
-    'ɪ', 'ɭ','#upr42#','ŋ','#upr44#','ɳ','ɔ','#upr47#','ɒ','ɽ',
-    'ʃ', 'θ','ʊ','ʌ','#pr54#','#upr55#','#upr56#','ʒ','#upr58#','#upr59#',
-    '#upr60#', '#upr61#','#upr62#','#upr63#']
-
-symbol = ['#SY0#', '#SY1#','„','…','§','#SY5#','#SY6#','#SY7#','‘','’',
-    '“', '”','#SY12#','—','#SY14#','™','#SY16#','¡','¢','£',
-    '¤', '#SY21#','#SY22#','§','©','#SY25#','#SY26#','#SY27#','®','°',
-    '#SY30#', '²','³','#SY33#','#SY34#','#SY35#','¹','#SY37#','#SY38#','#SY39#',
-    '½', '#SY41#','¿','×','÷','#SY45#','#SY46#','#SY47#','#SY48#','#SY49#',
-    '#SY50#', '#SY51#','#SY52#','#SY53#','#SY54#','#SY55#','#SY56#','#SY57#','#SY58#','#SY59#',
-    '#SY60#', '#SY61#','#SY62#','#SY63#']
-
-special = ['#SP0#', '!','"','#','$','%','&','\'','(',')',
-    '*', '+','#SP12#','#SP13#','#SP14#','/','0','1','2','3',
-    '4', '5','6','7','8','9',':',';','<','=',
-    '>', '?','@','[','\\',']','^','_','`','{',
-    '|', '}','~','#SP43#','#SP44#','#SP45#','#SP46#','#SP47#','#SP48#','#SP49#',
-    '#SP50#', '#SP51#','#SP52#','#SP53#','#SP54#','#SP55#','#SP56#','#SP57#','#SP58#','#SP59#',
-    '#SP60#', '#SP61#','#SP62#','#SP63#']
-
-wordclass = ('subs:','n:','adj:','pron:','num:','v:','adv:','prep:','conj:','part:',
-    'intr:','phr:','#WC12#','#WC13#','#WC14#','#WC15#','#WC16#','#WC17#','#WC18#','#WC19#',
-    'm/f:','m:','f:','#WC23#','#WC24#','#WC25#','#WC26#','#WC27#','#WC28#','#WC29#',
-    '#WC30#','#WC31#')
-
-
-subs = {
-       "#GRAVE#" : {
-          'a': 'à',
-          'e': 'è',
-          'u': 'û'
-          # '#SPECIAL#': '?' # what the hell is this one
-          # 'q': '?', # what the hell is this one
-          # 's': '?', # what the hell is this one
-       },
-       "#UML#" : {
-           'o': 'ö',
-           'u': 'ü',
-           'a': 'ä',
-           'e': 'ë',
-           'i': 'ï',
-           ' ': 'Ä',
-           '#DACUT#': 'Ö',
-           'β': 'Ü'
-       },
-       "#ACUTE#" : {
-           'a': 'á',
-           'e': 'é',
-           'i': 'í',
-           'n': 'ń',
-           'o': 'ó',
-           'u': 'ú',
-           'l': 'ĺ',
-           'r': 'ŕ',
-           'y': 'ý',
-           ' ': 'Á',
-           ',': 'É',
-           '#DACUT#':'Ó',
-           '#AL56#': 'Ý',
-           '#GRAVE#':'Í',
-           '#CEDIL#': 'Ŕ',
-           'β':'Ú',
-           '<':'Ć'
-       },
-       "#CARON#" : {
-           'r': 'ř',
-           'c': 'č',
-           's': 'š',
-           'z': 'ž',
-           'e': 'ě',
-           'd': 'ď',
-           't': 'ť',
-           'a': 'å',
-           'u': 'ů',
-           'n': 'ň',
-           'l': 'ľ',
-           '<': 'Č',
-           '>': 'Ď',
-           '#STROKE#': 'Š',
-           ' ': 'Å',
-           ',': 'Ě',
-           'β': 'Ů',
-           '#TILDE#': 'Ľ',
-           '#CEDIL#': 'Ř',
-           '#SHARP#': 'Ť',
-           '#AL45#': 'Ň',
-           '#AL57#': 'Ž'
-       },
-       "#SHARP#": {
-           's': 'ß',
-           'o': 'œ',
-           'a': 'æ',
-           '#DACUT#': 'Œ'
-       },
-        "#TILDE#": {
-           'n': 'ñ',
-           'o': 'õ',
-           'a': 'ã',
-           'i': 'ĩ'
-           # 'e': '?' # what the hell is this one
-           # '#SYMBOL#': '?' # what the hell is this one
-       },
-       "#CIRC#": {
-           'a': 'â',
-           'e': 'ê',
-           'o': 'ô',
-           'i': 'î',
-           'u': 'û',
-           ' ': 'Â',
-           ',': 'Ê', # used in french word survętement, but not decoded by Lingea
-           '#GRAVE#': 'Î', # used in french île, but not decoded by Lingea
-           '#DACUT#': 'Ô'
-       },
-       "#CEDIL#": {
-           'c': 'ç',
-           'e': 'ę',
-           'a': 'ą',
-           'k': 'ķ',
-           'i': 'ļ',
-           'n': 'ņ',
-           '<': 'Ç'
-           # 'j': '?' # what the hell is this one
-           # '#UML#': '?' # what the hell is this one (used in word Jesús)
-       },
-       "#DACUT#": {
-           'u': 'ű',
-           'z': 'ż',
-       },
-       "#STROKE#": {
-           'l': 'ł',
-       },
-       "#BREVE#": {
-           'a': 'ă',
-       },
-       "#PRON#": {
-           'el': 'ɛ',
-           'ou': 'ɶ',
-           'or': 'ɸ',
-           '#CEDIL#c': 'ʀ',
-           'hi': 'ɥ',
-           'nh': 'ɲ',
-           'ex': 'ɛ̃', 
-           'cv': 'ɔ̃',
-           'ov': 'œ̃',
-           'av': 'ɑ̃'
-       },
-       "#UPCASE#": upcase,
-       "#SYMBOL#": symbol,
-       "#SPECIAL#": special,
-     }
-
-# DECODE INDEX STRUCTURE OF FILE
-
-index = []
-f.seek(indexPos)
-bases = unpack("<%sL" % indexBaseCount, f.read(indexBaseCount * 4))
-if smallIndex: # In small dictionaries every base is used 4-times
-    bases4 = []
-    for i in bases:
-        bases4.extend([i,i,i,i])
-    bases = bases4
-for b in bases:
-    offsets = unpack("<64H", f.read(64*2))
-    for o in offsets:
-        if len(index) < indexOffsetCount:
-            #print "Index %s: %s + %s + %s * 4 = %s" % (len(index), bodyPos, b, o, toBin(bodyPos + b + o * 4))
-            index.append(bodyPos + b + o * 4)
+if BATCH is not None:
+    # CONVERT ALL DICTIONARIES OF DIRECTORY, ONE DICTIONARY IN EACH WORKER PROCESS
+    if not os.path.isdir(BATCH):
+        os.makedirs(BATCH)
+    start = time.time()
+    jobs, skipped = batch_jobs(FILENAME, BATCH)
+    if JOBS > 1:
+        pool = multiprocessing.Pool(JOBS)
+        try:
+            results = list(pool.imap_unordered(convert_file, jobs))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [convert_file(job) for job in jobs]
+    if print_batch_summary(FILENAME, results, skipped, time.time() - start):
+        sys.exit(1)
+    sys.exit(0)
+
+if VALIDATE is not None:
+    # VALIDATE ALL DICTIONARIES OF DIRECTORY, ONE DICTIONARY IN EACH WORKER PROCESS
+    start = time.time()
+    if os.path.isdir(FILENAME):
+        paths = find_dictionaries(FILENAME)
+    else:
+        paths = [FILENAME]
+    if JOBS > 1:
+        pool = multiprocessing.Pool(JOBS)
+        try:
+            reports = list(pool.imap_unordered(validate_file, paths))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        reports = [validate_file(path) for path in paths]
+    reports.sort(key=lambda report: report['file'])
+    report = open(VALIDATE, 'wb')
+    json.dump({'files': reports, 'seconds': time.time() - start}, report, indent=1, sort_keys=True)
+    report.write('\n')
+    report.close()
+    print "%-32s %10s %8s %8s %8s %8s %8s" % ("dictionary", "records", "wrong", "errors", "symbols", "flags", "s")
+    for report in reports:
+        print "%-32s %10d %8d %8d %8d %8d %8.2f" % (os.path.basename(report['file']), report['records'], report['wrong'], report['errors'],
+            len(report['unknownSymbols']), sum([len(bits) for bits in report['unhandledFlags'].values()]), report['seconds'])
+    if [report for report in reports if report['wrong'] or report['errors']]:
+        sys.exit(1)
+    sys.exit(0)
+
+reader = None
+if PROFILE:
+    # stages are timed in this process, records are read by profiling reader
+    profile = Profile()
+    profile.enable()
+    reader = profile.reader
+    JOBS = 1
+
+dictionary = Dictionary(FILENAME, OUTSTYLE, INDEXCACHE, reader=reader)
+entryCount = dictionary.entryCount
+# replaced by buffer of the file given by -f in modes writing to it
+out = OutputBuffer(sys.stdout)
+error = None
 
 # DECODE RECORDS
 
-if DEBUG:
-    # PRINTOUT DEBUG OF FIRST <DEBUGLIMIT> WRONG RECORDS:
+if LOOKUP is not None:
+    # PRINT RECORDS FOUND IN HEADWORD INDEX
+    out = open_output()
+    for s in dictionary.lookup(LOOKUP, LOOKUPPREFIX):
+        out.write(s)
+        if not s.endswith('\n'):
+            out.write('\n')
+elif STARDICT is not None:
+    # WRITE STARDICT DICTIONARY FILES
+    try:
+        write_stardict(STARDICT, entries(dictionary), OUTSTYLE, DICTZIP)
+    except RecordStructureError, e:
+        sys.stderr.write("!!! RECORD STRUCTURE DECODING ERROR !!!\n%s\n" % e)
+        sys.exit(1)
+elif COLUMNS is not None:
+    # WRITE DECODED ENTRIES TO COLUMNAR FILE
+    columns = ColumnWriter(COLUMNS, SORTED)
+    separator = dictionary.tag['rn'][1]
+    i = 0 # number of record, chunks are in original order
+    for strings, error in ordered_chunks(decode_records, record_chunks(entryCount)):
+        for s in strings:
+            i += 1
+            if not s.endswith('\n'):
+                sys.stderr.write("!!! %s !!! in record %s\n%s\n" % (STRUCTUREERROR, i, s))
+                sys.exit(1)
+            columns.add(*split_record(s[:-1], separator))
+        if error is not None:
+            break
+    if error is None:
+        columns.close()
+elif HEADWORDS:
+    # PRINT HEADWORD OF EACH RECORD, DATA BLOCKS ARE SKIPPED
+    out = open_output()
     for i in range(1,entryCount):
-        if not DEBUGALL:
-            DEBUG = False
-        s = decode(getRec(i))
-        if DEBUGHEADER:
-            # print s.split('\t')[0]
-            print s
-        if DEBUGLIMIT > 0 and not s.endswith('\n'):
-            DEBUG = True
-            print "-"*80
-            print "%s) at address %s" % (i, toBin(index[i]))
-            print
-            s = decode(getRec(i))
-            print s
-            DEBUGLIMIT -= 1
-    DEBUG = True
+        s = decode(dictionary.reader(dictionary.getRec(i), dictionary), dictionary, True)
+        separator = dictionary.tag['rn'][1]
+        if separator in s:
+            # inline tags are rewritten as in the headword column of converted records
+            out.write(decode_tag_postprocessing(s.split(separator)[0], OUTSTYLE) + '\n')
+elif DEBUG:
+    # VALIDATE ALL RECORDS IN ONE PASS, PRINTOUT DEBUG OF FIRST <DEBUGLIMIT> WRONG RECORDS
+    wrong = []
+    for results in ordered_chunks(validate_records, record_chunks(entryCount)):
+        for i, s, failure in results:
+            if DEBUGALL:
+                trace_record(i)
+            if DEBUGHEADER:
+                # print s.split('\t')[0]
+                print s
+            if failure is not None:
+                wrong.append((i,) + failure)
+                if DEBUGLIMIT > 0:
+                    print "-"*80
+                    print "%s) at address %s" % (i, toBin(dictionary.index[i]))
+                    print
+                    print trace_record(i)
+                    DEBUGLIMIT -= 1
+    print "="*80
+    print "Validated %s records, %s wrong" % (entryCount - 1, len(wrong))
+    for i, offset, pos, length, error in wrong:
+        # decoding diverged at pos: blocks ended before nonzero bytes or an exception was raised there
+        print "%s) at address %s: decoded %s of %s bytes%s" % (i, toBin(offset), pos, length, error and ", " + error or "")
+    if wrong:
+        sys.exit(1)
+elif FORMATS:
+    # DECODE EACH RECORD ONCE, WRITE IT IN ALL FORMATS
+    outs = [OutputBuffer(open(OUTPUT + formatExtensions[f], 'wb')) for f in FORMATS]
+    for results, wrong, error in ordered_chunks(render_records, record_chunks(entryCount)):
+        for strings, f, formatOut in zip(results, FORMATS, outs):
+            formatOut.writelines(strings)
+            if wrong is not None and f != 'json': # json line of the wrong record has "complete": false
+                print_structure_error(formatOut)
+        if wrong is not None:
+            sys.stderr.write("!!! %s !!! in record %s\n" % (STRUCTUREERROR, wrong))
+            error = STRUCTUREERROR
+        if error is not None:
+            break
+    for formatOut in outs:
+        formatOut.close()
+elif UPDATE:
+    # DECODE RECORDS CHANGED SINCE PREVIOUS OUTPUT, COPY THE OTHERS
+    count, error, copied = update_output(OUTPUT)
+    sys.stderr.write("%s records, %s decoded, %s copied from previous output\n" % (count, count - copied, copied))
 else:
     # DECODE EACH RECORD AND PRINT IT IN FORMAT FOR stardict-editor <term>\t<definition>
-    for i in range(1,entryCount):
-        s = decode(getRec(i))
-        if s.endswith('\n'):
-            print s,
-        else:
-            print s
-            print "!!! RECORD STRUCTURE DECODING ERROR !!!"
-            print "Please run this script in DEBUG mode and repair DATA BLOCK(S) section in function decode()"
-            print "If you succeed with whole dictionary send report (name of the dictionary and source code of script) to slovniky@googlegroups.com"
-            break
+    # chunks of records are decoded in worker processes with -j, printed in original order
+    out = open_output()
+    count, error = print_records(ordered_chunks(decode_records, record_chunks(entryCount)), out)
+
+if error not in (None, STRUCTUREERROR):
+    # traceback of exception in decode()
+    out.flush()
+    sys.stderr.write(error)
+    sys.exit(1)
+
+out.close()
+
+if PROFILE:
+    profile.disable()
+    sys.stderr.write(json.dumps(profile.stats(), indent=1, sort_keys=True) + '\n')
+
+if FORMATS and error == STRUCTUREERROR:
+    sys.exit(1)
@@ -0,0 +1,1669 @@
+# -*- coding: utf-8 -*-
+#
+# Library for decoding Lingea Dictionary (.trd) files,
+# command line interface is lingea-trd-decoder.py
+#
+# Copyright (C) 2007 - Klokan Petr Přidal (www.klokan.cz)
+# Authors and version history are in lingea-trd-decoder.py
+#
+# Importing the module does not read anything, dictionaries are opened by
+# Dictionary(path) and decoded record by record:
+#
+#   for n, headword, definition in iter_entries("lg_encz-2.trd", style=0):
+#       ...
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Library General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+
+from struct import *
+import re, sys
+import mmap, os, collections
+import bisect, heapq, tempfile, zlib, time, hashlib, json
+from array import array
+
+# Output tags for every output style
+tags = {}
+tags[0] = {
+           'db':(''   ,''),    #Data beginning
+           'rn':(''   ,'\t'),  #Record name
+           'va':(''   ,' '),   #Header variant
+           'wc':('('  ,')'),   #WordClass
+           'pa':(''   ,' '),   #Header parts
+           'fo':('('  ,') '),  #Header forms
+           'on':('('  ,')' ),  #Header origin note
+           'pr':('['  ,']'),   #Header pronunciation; not printed by Lingea
+           'du':('('  ,')'),   #Data sub example
+           'dc':('('  ,')'),   #Data sub shortcut
+           'hs':('('  ,') '),  #Header source
+           'dv':('{'  ,'} '),  #Header dataVariant
+           'sh':(''   ,''),    #Header shortcut
+           'pv':('/'  ,'/ '),  #Header plural variant
+           'ex':('('  ,') '),  #Header example
+           'sa':('`'  ,'`' ),  #Data sample
+           'sw':(''   ,''),    #Data sample wordclass; is no printed by Lingea (it is printed only in French?)
+           'do':('`'  ,'`' ),  #Data origin note
+           'df':(''   ,' '),   #Data definition
+           'nt':(''   ,' '),   #Data note
+           'ps':('"'  ,'" '),  #Data phrase short form
+           'pg':('"'  ,' = '), #Data phrase green
+           'pc':('`'  ,'`'),   #Data phrase comment; this comment is not printed by Lingea, but it seems useful
+           'p1':('"'  ,' = '), #Data phrase 1
+           'p2':(''   ,'" ' ), #Data phrase 2
+           'rs':('SYNONYM: ' ,'' ), #Reference synonym
+           'rr':('HYPERNYM: ','' ), #Reference hypernym
+           'rp':('HYPONYM: ' ,'' ), #Reference hyponym
+           'sp':('"'  ,' = ' ),#Data simple phrase
+           'b1':('"'  ,' = '), #Data phrase (block) 1
+           'b2':('" ' ,''),    #Data phrase (block) 2
+           }
+tags[1] = {
+           'db':('•'       ,''),      #Data beginning
+           'rn':(''        ,'\t'),    #Record name
+           'va':(''        ,' '),     #Header variant
+           'wc':(''        ,'\\n'),   #WordClass
+           'pa':(''        ,':\\n'),  #Header parts
+           'fo':('('       ,') '),    #Header forms
+           'on':('('       ,')\\n' ), #Header origin note
+           'pr':('['       ,']\\n'),  #Header pronunciation; not printed by Lingea
+           'du':('('       ,')'),     #Data sub example
+           'dc':('('       ,')'),     #Data sub shortcut
+           'hs':('('       ,')\\n'),  #Header source
+           'dv':('{'       ,'} '),    #Header dataVariant
+           'sh':(''        ,'\\n'),   #Header shortcut
+           'pv':('/'       ,'/\\n'),  #Header plural variant
+           'ex':('('       ,')\\n'),  #Header example
+           'sa':('    '    ,'\\n' ),  #Data sample
+           'sw':(''        ,''),      #Data sample wordclass; is not printed by Lingea (it is printed in only in French?)
+           'do':('    '    ,' ' ),    #Data origin note
+           'df':('    '    ,'\\n'),   #Data definition
+           'nt':('    '    ,'\\n'),   #Data note
+           'ps':('    '    ,'\\n'),   #Data phrase short form
+           'pg':('    '    ,' '),     #Data phrase green
+           'pc':('    '    ,' '),     #Data phrase comment; this comment is not printed by Lingea, but it seems useful
+           'p1':('    '    ,' '),     #Data phrase 1
+           'p2':('      '  ,'\\n' ),  #Data phrase 2
+           'rs':('SYNONYM: ' ,'\\n' ),#Reference synonym
+           'rr':('HYPERNYM: ','\\n' ),#Reference hypernym
+           'rp':('HYPONYM: ' ,'\\n' ),#Reference hyponym
+           'sp':('    '    ,'\\n' ),  #Data simple phrase
+           'b1':('"'       ,' = '),   #Data phrase (block) 1
+           'b2':('" '      ,''),      #Data phrase (block) 2
+          }
+tags[2] = {
+           'db':('•'                                                 ,''),              #Data beginning
+           'rn':(''                                                  ,'\t'),            #Record name
+           'va':(''                                                  ,' '),             #Header variant
+           'wc':('<span size="larger" color="darkred" weight="bold">','</span>\\n'),    #WordClass
+           'pa':('<span size="larger" color="darkred" weight="bold">',':</span>\\n'),   #Header parts
+           'fo':('('                                                 ,') '),            #Header forms
+           'on':('<span color="blue">('                              ,')</span>\\n' ),  #Header origin note
+           'pr':('['                                                 ,']\\n'),          #Header pronunciation; not printed by Lingea
+           'du':('('                                                 ,')'),             #Data sub example
+           'dc':('('                                                 ,')'),             #Data sub shortcut
+           'hs':('('                                                 ,')\\n'),          #Header source
+           'dv':('{'                                                 ,'} '),            #Header dataVariant
+           'sh':(''                                                  ,'\\n'),           #Header shortcut
+           'pv':('/'                                                 ,'/\\n'),          #Header plural variant
+           'ex':('('                                                 ,')\\n'),          #Header example
+           'sa':('    <span color="darkred" weight="bold">'          ,'</span>\\n' ),   #Data sample
+           'sw':(''                                                  ,''),              #Data sample wordclass; is not printed by Lingea (it is printed in only in French?)
+           'do':('    <span color="darkred" weight="bold">'          ,'</span> ' ),     #Data origin note
+           'df':('    <span weight="bold">'                          ,'</span>\\n'),    #Data definition
+           'nt':(''                                                  ,''),              #Data note
+           'ps':('    <span color="dimgray" weight="bold">'          ,'</span>\\n'),    #Data phrase short form
+           'pg':('    <span color="darkgreen" style="italic">'       ,'</span> '),      #Data phrase green
+           'pc':('    <span color="darkgreen" style="italic">'       ,'</span> '),      #Data phrase comment; this comment is not printed by Lingea, but it seems useful
+           'p1':('    <span color="dimgray" style="italic">'         ,'</span> '),      #Data phrase 1
+           'p2':('      '                                            ,'\\n' ),          #Data phrase 2
+           'rs':('SYNONYM: '                                         ,'\\n' ),          #Reference synonym
+           'rr':('HYPERNYM: '                                        ,'\\n' ),          #Reference hypernym
+           'rp':('HYPONYM: '                                         ,'\\n' ),          #Reference hyponym
+           'sp':('    <span color="cyan">'                           ,'</span>\\n' ),   #Data simple phrase
+           'b1':('"'                                                 ,' = '),           #Data phrase (block) 1
+           'b2':('" '                                                ,''),              #Data phrase (block) 2
+          }
+
+
+
+################################################################
+# TRANSLATION TABLES
+################################################################
+
+# smallIndex dictionaries
+alphaSmall = ['\x00', 'a','b','c','d','e','f','g','h','i',
+       'j','k','l','m','n','o','p','q','r','s',
+       't','u','v','w','x','y','z','á','ä','č',
+       'ď','é', 'ě', 'í', '#AL34#', '#AL35#', 'ň', 'ó', 'ö', '#AL39#',
+       'ř', 'š', 'ť', 'ú', 'ů', 'ü', 'ý', 'ž', 'ß', ' ',
+       '.', ',', '-', '\'', '(', ')', '`', '"', '#AL58#', '#AL59#',
+       '#UPCASE#', 'à', '#SPECIAL#', "#AL1234213"] # 4 bytes after unicode
+
+upcaseSmall = ['\x00', 'A','B','C','D','E','F','G','H','I',
+       'J','K','L','M','N','O','P','Q','R','S',
+       'T','U','V','W','X','Y','Z','Á','Ä','Č',
+       'Ď','É', 'Ě', 'Í', '<', '>', 'Ň', 'Ó', '-', '#UP39#',
+       'Ř', 'Š', 'Ť', 'Ú', 'Ů', 'Ü', 'Ý', 'Ž', '#UP48#', ' ',
+       '#UP.#', '#UP,#', '#UP-#', '#UP\'#', '#UP(#', '#UP)#', '#UP`#', '#UP"#', '#UP58#', '#UP59#',
+       '#~UPCASE#', 'À', '#UP/#'] # 4 bytes after unicode
+
+# other dictionaries
+alphaLarge = ['\x00', 'a','b','c','d','e','f','g','h','i',
+       'j','k','l','m','n','o','p','q','r','s',
+       't','u','v','w','x','y','z','#AL27#','#AL28#','#AL29#',
+       '#AL30#','#AL31#', ' ', '.', '<', '>', ',', ';', '-', '#AL39#',
+       '#GRAVE#', '#ACUTE#', '#CIRC#', '#TILDE#', '#UML#', '#AL45#', '#DACUT#', '#CARON#', '#BREVE#', '#CEDIL#',
+       '#STROKE#', '#SHARP#', 'β', '#AL53#', '#AL54#', '#AL55#', '#AL56#', '#AL57#', 's', '#SYMBOL#', # symbol 58 is used in Spanish word pillo as s (seimpre)
+       '#PRON#', '#UPCASE#', '#SPECIAL#', '#UNICODE#'] # 4 bytes after unicode
+
+upcaseLarge = ['#UP0#','#UP1#','#UP2#','#UP3#','#UP4#','#UP5#','#UP6#','#UP7#','#UP8#','#UP9#',
+       '#UP10#','#UP11#','#UP12#','#UP13#','#UP14#','#UP15#','#UP16#','#UP17#','#UP18#','#UP19#',
+       '#UP20#','#UP21#','#UP22#','#UP23#','#UP24#','#UP25#','#UP26#','#UP27#','#UP28#','#UP29#',
+       '#UP30#','#UP31#','A','B','C','D','E','F','G','H',
+       'I','J','K','L','M','N','O','P','Q','R',
+       'S','T','U','V','W','X','Y','Z','#UP58#','#UP59#',
+       '#UP60#','#UP61#','#UP62#','#UP63#']
+
+upcase_pron = ['#upr0#', '#upr1#','#upr2#','#upr3#','#upr4#','#upr5#','#upr6#','#upr7#','#upr8#','#upr9#',
+    '#upr10#', '#upr11#','#upr12#','#upr13#','#upr14#','#upr15#','#upr16#','#upr17#','#upr18#','#upr19#',
+    '#upr20#', '#upr21#','#upr22#','#upr23#','#upr24#','#upr25#','#upr26#','#upr27#','#upr28#','#upr29#',
+    '#upr30#', '#upr31#','ɑ','#upr33#','ʧ','ð','ə','ɜ','#upr38#','æ',
+    'ɪ', 'ɭ','#upr42#','ŋ','#upr44#','ɳ','ɔ','#upr47#','ɒ','ɽ',
+    'ʃ', 'θ','ʊ','ʌ','#pr54#','#upr55#','#upr56#','ʒ','#upr58#','#upr59#',
+    '#upr60#', '#upr61#','#upr62#','#upr63#']
+
+symbol = ['#SY0#', '#SY1#','„','…','§','#SY5#','#SY6#','#SY7#','‘','’',
+    '“', '”','#SY12#','—','#SY14#','™','#SY16#','¡','¢','£',
+    '¤', '#SY21#','#SY22#','§','©','#SY25#','#SY26#','#SY27#','®','°',
+    '#SY30#', '²','³','#SY33#','#SY34#','#SY35#','¹','#SY37#','#SY38#','#SY39#',
+    '½', '#SY41#','¿','×','÷','#SY45#','#SY46#','#SY47#','#SY48#','#SY49#',
+    '#SY50#', '#SY51#','#SY52#','#SY53#','#SY54#','#SY55#','#SY56#','#SY57#','#SY58#','#SY59#',
+    '#SY60#', '#SY61#','#SY62#','#SY63#']
+
+special = ['#SP0#', '!','"','#','$','%','&','\'','(',')',
+    '*', '+','#SP12#','#SP13#','#SP14#','/','0','1','2','3',
+    '4', '5','6','7','8','9',':',';','<','=',
+    '>', '?','@','[','\\',']','^','_','`','{',
+    '|', '}','~','#SP43#','#SP44#','#SP45#','#SP46#','#SP47#','#SP48#','#SP49#',
+    '#SP50#', '#SP51#','#SP52#','#SP53#','#SP54#','#SP55#','#SP56#','#SP57#','#SP58#','#SP59#',
+    '#SP60#', '#SP61#','#SP62#','#SP63#']
+
+wordclass = ('subs:','n:','adj:','pron:','num:','v:','adv:','prep:','conj:','part:',
+    'intr:','phr:','#WC12#','#WC13#','#WC14#','#WC15#','#WC16#','#WC17#','#WC18#','#WC19#',
+    'm/f:','m:','f:','#WC23#','#WC24#','#WC25#','#WC26#','#WC27#','#WC28#','#WC29#',
+    '#WC30#','#WC31#')
+
+
+subs = {
+       "#GRAVE#" : {
+          'a': 'à',
+          'e': 'è',
+          'u': 'û'
+          # '#SPECIAL#': '?' # what the hell is this one
+          # 'q': '?', # what the hell is this one
+          # 's': '?', # what the hell is this one
+       },
+       "#UML#" : {
+           'o': 'ö',
+           'u': 'ü',
+           'a': 'ä',
+           'e': 'ë',
+           'i': 'ï',
+           ' ': 'Ä',
+           '#DACUT#': 'Ö',
+           'β': 'Ü'
+       },
+       "#ACUTE#" : {
+           'a': 'á',
+           'e': 'é',
+           'i': 'í',
+           'n': 'ń',
+           'o': 'ó',
+           'u': 'ú',
+           'l': 'ĺ',
+           'r': 'ŕ',
+           'y': 'ý',
+           ' ': 'Á',
+           ',': 'É',
+           '#DACUT#':'Ó',
+           '#AL56#': 'Ý',
+           '#GRAVE#':'Í',
+           '#CEDIL#': 'Ŕ',
+           'β':'Ú',
+           '<':'Ć'
+       },
+       "#CARON#" : {
+           'r': 'ř',
+           'c': 'č',
+           's': 'š',
+           'z': 'ž',
+           'e': 'ě',
+           'd': 'ď',
+           't': 'ť',
+           'a': 'å',
+           'u': 'ů',
+           'n': 'ň',
+           'l': 'ľ',
+           '<': 'Č',
+           '>': 'Ď',
+           '#STROKE#': 'Š',
+           ' ': 'Å',
+           ',': 'Ě',
+           'β': 'Ů',
+           '#TILDE#': 'Ľ',
+           '#CEDIL#': 'Ř',
+           '#SHARP#': 'Ť',
+           '#AL45#': 'Ň',
+           '#AL57#': 'Ž'
+       },
+       "#SHARP#": {
+           's': 'ß',
+           'o': 'œ',
+           'a': 'æ',
+           '#DACUT#': 'Œ'
+       },
+        "#TILDE#": {
+           'n': 'ñ',
+           'o': 'õ',
+           'a': 'ã',
+           'i': 'ĩ'
+           # 'e': '?' # what the hell is this one
+           # '#SYMBOL#': '?' # what the hell is this one
+       },
+       "#CIRC#": {
+           'a': 'â',
+           'e': 'ê',
+           'o': 'ô',
+           'i': 'î',
+           'u': 'û',
+           ' ': 'Â',
+           ',': 'Ê', # used in french word survętement, but not decoded by Lingea
+           '#GRAVE#': 'Î', # used in french île, but not decoded by Lingea
+           '#DACUT#': 'Ô'
+       },
+       "#CEDIL#": {
+           'c': 'ç',
+           'e': 'ę',
+           'a': 'ą',
+           'k': 'ķ',
+           'i': 'ļ',
+           'n': 'ņ',
+           '<': 'Ç'
+           # 'j': '?' # what the hell is this one
+           # '#UML#': '?' # what the hell is this one (used in word Jesús)
+       },
+       "#DACUT#": {
+           'u': 'ű',
+           'z': 'ż',
+       },
+       "#STROKE#": {
+           'l': 'ł',
+       },
+       "#BREVE#": {
+           'a': 'ă',
+       },
+       "#PRON#": {
+           'el': 'ɛ',
+           'ou': 'ɶ',
+           'or': 'ɸ',
+           '#CEDIL#c': 'ʀ',
+           'hi': 'ɥ',
+           'nh': 'ɲ',
+           'ex': 'ɛ̃', 
+           'cv': 'ɔ̃',
+           'ov': 'œ̃',
+           'av': 'ɑ̃'
+       },
+       "#SYMBOL#": symbol,
+       "#SPECIAL#": special,
+     }
+
+
+# Print color debug functions
+purple = lambda c: '\x1b[1;35m'+c+'\x1b[0m'
+blue = lambda c: '\x1b[1;34m'+c+'\x1b[0m'
+cyan = lambda c: '\x1b[36m'+c+'\x1b[0m'
+gray = lambda c: '\x1b[1m'+c+'\x1b[0m'
+
+# Pair of 6-bit symbols for every 12-bit half of a 3-byte group
+symbolPairs = [(v >> 6, v & 63) for v in range(4096)]
+
+def decode_alpha_groups( stream, start, dictionary ):
+    """Decode 6-bit encoding data stream from the start position until first NULL, whole 3-byte groups at once"""
+    # Same result as symbol after symbol decoding (checked by lingea-trd-check.py): the 4th symbol
+    # of a group is decoded only if another byte follows the group. The stream is read in place, never sliced.
+    length = len( stream )
+    full = length - 3
+    triple = start
+    result = []
+    while triple < length:
+        if triple < full:
+            b1 = stream[triple+1]
+            group = symbolPairs[stream[triple] << 4 | b1 >> 4] + symbolPairs[(b1 & 15) << 8 | stream[triple+2]]
+        else:
+            b1 = triple + 1 < length and stream[triple+1] or 0
+            b2 = triple + 2 < length and stream[triple+2] or 0
+            group = (symbolPairs[stream[triple] << 4 | b1 >> 4] + symbolPairs[(b1 & 15) << 8 | b2])[:length - triple]
+        if 0 in group:
+            null = group.index(0)
+            result.extend(group[:null])
+            return decode_alpha_postprocessing(result, dictionary), triple - start + min(null, 2)
+        result.extend(group)
+        triple += 3
+    return decode_alpha_postprocessing(result, dictionary), length - start - 1
+
+
+def symbol_tables(alpha, subs):
+    """Compile alphabet and subs rules into tables indexed by symbol codes"""
+    # plain[code] - string of the symbol, None if the symbol combines with the next one(s)
+    # combined[code] - (number of symbols, string for next code or for next two codes as next << 6 | next2)
+    plain = []
+    combined = []
+    for c in alpha:
+        if c[0] == '#':
+            plain.append(None)
+            if c not in subs:
+                combined.append((2, [c] * len(alpha))) # debug, next symbol is skipped
+            elif c in ("#UPCASE#", "#SPECIAL#", "#SYMBOL#"):
+                combined.append((2, list(subs[c])))
+            elif c == "#PRON#":
+                combined.append((3, [subs[c].get(c1 + c2, c + c1 + c2) for c1 in alpha for c2 in alpha])) # c + cc for debug
+            else:
+                combined.append((2, [subs[c].get(c1, c + c1) for c1 in alpha])) # c + c1 for debug
+        else:
+            plain.append(c)
+            combined.append(None)
+    return plain, combined
+
+def decode_alpha_postprocessing( input, dictionary ):
+    """Lowlevel alphabet decoding postprocessing, combines tuples into one character"""
+    plain = dictionary.plain
+    combined = dictionary.combined
+    result = []
+    input.extend([0x00]*5)
+
+    # UPCASE, UPCASE_PRON, SYMBOL, SPECIAL
+    i = 0
+    end = len(input) - 1
+    while i < end:
+        bc = input[i]
+        c = plain[bc]
+        if c is not None:
+            result.append(c)
+            i += 1
+        else:
+            width, table = combined[bc]
+            if width == 2:
+                result.append(table[input[i+1]])
+            else:
+                result.append(table[input[i+1] << 6 | input[i+2]])
+            i += width
+
+    return "".join(result)
+
+def pronunciation_table(upcase):
+    """Compile translation of single character upcase symbols into IPA symbols for unicode.translate()"""
+    table = {}
+    for u, p in zip(upcase, upcase_pron):
+        u = u.decode('utf-8')
+        if len(u) == 1 and ord(u) not in table:
+            table[ord(u)] = p.decode('utf-8')
+    return table
+
+def pronunciation_encode(s, dictionary):
+    """Encode pronunciation upcase symbols into IPA symbols"""
+    if '#' in s:
+        # Multi character symbols (#UP39#, ...) and IPA placeholders (#upr33#, ...) interact,
+        # replace one symbol after another
+        for u, p in zip(dictionary.upcase, upcase_pron):
+            s = s.replace(u, p)
+        return s
+    return s.decode('utf-8').translate(dictionary.pronunciation).encode('utf-8')
+
+# Lingea inline tags <x...>, in the order of rewriting
+inlineTagLetters = 'acdeEfghiIlLnNopqrtuvwxyz^' # g: language
+re_tag = re.compile(r'<([acdeEfghiIlLnNopqrtuvwxyz^])(.*?)>')
+re_tag_open = re.compile(r'<[acdeEfghiIlLnNopqrtuvwxyz^]')
+re_tags = [re.compile('<' + re.escape(letter) + '(.*?)>') for letter in inlineTagLetters]
+
+# Replacement of inline tags for every output style
+inlineTags = {}
+inlineTags[0] = dict([(letter, ('(', ')')) for letter in inlineTagLetters])
+inlineTags[1] = inlineTags[0]
+inlineTags[2] = dict([(letter, ('<span size="small" color="blue" style="italic">', '</span>')) for letter in inlineTagLetters])
+inlineTags[2]['d'] = ('<span size="small" color="blue">(', ')</span>')
+inlineTags[2]['x'] = ('<span size="small" color="brown" style="italic">', '</span>')
+
+def decode_tag_postprocessing(input, outStyle):
+    """Decode and replace tags used in Lingea dictionaries; decode internal tags"""
+
+    # General information in http://www.david-zbiral.cz/El-slovniky-plnaverze.htm#_Toc151656799
+    # TODO: Better output handling
+
+    replacement = inlineTags[outStyle]
+    nested = []
+    def rewrite(m):
+        content = m.group(2)
+        if '<' in content and re_tag_open.search(content):
+            nested.append(m)
+        prefix, suffix = replacement[m.group(1)]
+        return prefix + content + suffix
+    s = re_tag.sub(rewrite, input)
+
+    if nested:
+        # Tag inside of tag: result depends on the order of rewriting, rewrite letter after letter
+        s = input
+        for letter, r in zip(inlineTagLetters, re_tags):
+            prefix, suffix = replacement[letter]
+            s = r.sub(lambda m: prefix + m.group(1) + suffix, s)
+
+    return s
+
+def toBin( b ):
+    """Prettify debug output format: hex(bin)dec"""
+    original = b
+    r = 0;
+    i = 1;
+    while b > 0:
+        if b & 0x01 != 0: r += i
+        i *= 10
+        b = b >> 1
+    return "0x%02X(%08d)%03d" % (original, r, original)
+
+
+class Dictionary(object):
+    """Lingea dictionary file: header, index of records, translation tables and output tags"""
+    __slots__ = ('path', 'identity', 'body', 'copyright', 'entryCount', 'smallIndex', 'bodyPos', 'index', 'headwords', 'headwordOrder', 'headwordIndex',
+                 'cache', 'reader', 'alpha', 'upcase', 'subs', 'plain', 'combined', 'pronunciation', 'outStyle', 'tag')
+
+    def __init__(self, path, outStyle = 2, indexCache = False, cache = None, reader = None):
+        self.path = path
+        # factory of record readers reader(stream, dictionary), RecordReader by default
+        self.reader = reader or RecordReader
+        f = open(path,'rb')
+        stat = os.fstat(f.fileno())
+        # decoded records of the same file are shared in RecordCache by all Dictionary instances
+        self.identity = (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime)
+        self.cache = cache
+
+        # records are read from memory mapped file, shared in page cache with worker processes
+        self.body = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # DECODE HEADER OF FILE
+        self.copyright = unpack("<64s",f.read(64))[0]
+        a = unpack("<16L",f.read(64))
+
+        self.entryCount = a[4]
+        indexBaseCount = a[6]
+        indexOffsetCount = a[7]
+        indexPos = a[9]
+        self.bodyPos = a[10]
+        self.smallIndex = (a[3] == 2052)
+
+        # DECODE INDEX STRUCTURE OF FILE
+        cached = None
+        self.headwords = None
+        self.headwordOrder = None
+        if indexCache:
+            cached = read_index_cache(path + '.idx', self.copyright, stat)
+        if cached:
+            (self.entryCount, self.smallIndex, self.bodyPos), self.index, self.headwords, self.headwordOrder = cached
+        else:
+            self.index = read_index(f, indexPos, indexBaseCount, indexOffsetCount, self.bodyPos, self.smallIndex)
+            if indexCache:
+                self.headwords = headword_offsets(self.body, self.index, self.entryCount)
+        f.close()
+        self.headwordIndex = None
+
+        # TRANSLATION TABLES
+        if self.smallIndex: # TODO: smallIndex might not correspond with encoding
+            self.alpha = alphaSmall
+            self.upcase = upcaseSmall
+        else:
+            self.alpha = alphaLarge
+            self.upcase = upcaseLarge
+        self.subs = dict(subs)
+        self.subs["#UPCASE#"] = self.upcase
+        self.plain, self.combined = symbol_tables(self.alpha, self.subs)
+        self.pronunciation = pronunciation_table(self.upcase)
+        self.outStyle = outStyle
+        self.tag = tags[outStyle]
+
+        if indexCache and not cached:
+            # sorting of headwords needs translation tables
+            self.headwordOrder = headword_order(self)
+            try:
+                write_index_cache(path + '.idx', self.copyright, stat, (self.entryCount, self.smallIndex, self.bodyPos), self.index, self.headwords, self.headwordOrder)
+            except (IOError, OSError), e:
+                sys.stderr.write("Index cache not written: %s\n" % e)
+
+    def getRec(self, n):
+        """Get data stream for record of given number, zero-copy slice of the memory mapped file"""
+        if n >= 0 and n < self.entryCount:
+            return buffer(self.body, self.index[n], self.index[n+1] - self.index[n])
+        else:
+            return ''
+
+    def getHeadword(self, n):
+        """Get header record name of record of given number without decoding the rest of the record, None if it has no name"""
+        if self.headwords is not None:
+            p = self.headwords[n]
+        else:
+            p = headword_offset(self.body, self.index, n)
+        if not p:
+            return None
+        # plain reader, header slice is not a record for profiling reader
+        return RecordReader(buffer(self.body, p, self.index[n+1] - p), self).read_str().replace('_','') # Remove character '_' from index
+
+    def getDecoded(self, n):
+        """Decode record of given number, through RecordCache if the dictionary has one"""
+        if self.cache is None:
+            return decode(self.reader(self.getRec(n), self), self)
+        key = (self.identity, n, self.outStyle)
+        s = self.cache.get(key)
+        if s is None:
+            s = decode(self.reader(self.getRec(n), self), self)
+            self.cache.put(key, s)
+        return s
+
+    def lookup(self, word, prefix = False):
+        """Decode records with given headword (or headword prefix), the headword index is built on the first lookup
+        unless sorted headwords are in the index cache"""
+        if self.headwordIndex is None:
+            self.headwordIndex = HeadwordIndex(self)
+        return [self.getDecoded(n) for n in self.headwordIndex.find(word, prefix)]
+
+class RecordReader(object):
+    """Cursor over byte stream of one record
+
+    Comments of read values are used just by TracingReader in DEBUG mode,
+    bytes of flags are read by read_flag() with name of the flag"""
+    __slots__ = ('dictionary', 'bs', 'pos')
+
+    def __init__(self, stream, dictionary):
+        self.dictionary = dictionary
+        # bs - list of bytes from stream
+        self.bs = unpack("<%sB" % len(stream), stream)
+        self.pos = 0
+
+    def read_int(self, comment = ""):
+        """Read next byte"""
+        pos = self.pos
+        self.pos = pos + 1
+        return self.bs[pos]
+
+    def read_flag(self, name, comment = ""):
+        """Read next byte, flag bits of given name"""
+        pos = self.pos
+        self.pos = pos + 1
+        return self.bs[pos]
+
+    def read_str(self, comment = ""):
+        """Read next string"""
+        pos = self.pos
+        s, triple = decode_alpha_groups(self.bs, pos, self.dictionary)
+        self.pos = pos + triple + 1
+        return s.split('\x00')[0].replace('`','') # give me string until first NULL, remove '`' character from words
+
+class TracingReader(RecordReader):
+    """RecordReader printing every read value with its address and comment, DEBUG mode"""
+    __slots__ = ('dataBlock',)
+
+    def __init__(self, stream, dictionary):
+        RecordReader.__init__(self, stream, dictionary)
+        self.dataBlock = 0
+
+    def read_int(self, comment = ""):
+        """Read next byte and output DEBUG info"""
+        bs = self.bs
+        pos = self.pos
+        print "%03d %s %s | %03d" % (pos, toBin(bs[pos]),comment, pos)
+        self.pos = pos + 1
+        return bs[pos]
+
+    def read_flag(self, name, comment = ""):
+        """Read next flag byte and output DEBUG info, comment of data block flag gets number of the block"""
+        if name == 'dataFlag':
+            comment = comment % self.dataBlock
+            self.dataBlock += 1
+        return self.read_int(comment)
+
+    def read_str(self, comment = ""):
+        """Read next string and output DEBUG info"""
+        bs = self.bs
+        pos = self.pos
+
+        s, triple  = decode_alpha_groups(bs, pos, self.dictionary)
+        s = s.split('\x00')[0] # give me string until first NULL
+        if (comment.find('%') != -1):
+            comment = comment % s
+        print "%03d %s %s | %s" % (pos, toBin(bs[pos]),comment, s)
+        self.pos = pos + triple + 1
+        return s.replace('`','') # Remove '`' character from words
+
+class Record(object):
+    """Decoded record before formatting: header fields, data blocks and result of the end of record check
+
+    Fields are pairs (tag key, text); text of fields with key None is written as it is.
+    End is the position in record where decoding of blocks stopped, the rest has to be zeros."""
+    __slots__ = ('header', 'blocks', 'complete', 'end')
+
+    def __init__(self):
+        self.header = []
+        self.blocks = []
+        self.complete = False
+        self.end = 0
+
+class DataBlock(object):
+    """Data block of record: fields written in front of the item, fields of the item, number of item (0 if not numbered)"""
+    __slots__ = ('lead', 'item', 'number')
+
+    def __init__(self, lead, item, number):
+        self.lead = lead
+        self.item = item
+        self.number = number
+
+def parse(reader, dictionary, headerOnly = False):
+    """Decode byte stream of one record into Record, formatting is left to renderers
+
+    With headerOnly just the header block is decoded"""
+    record = Record()
+    header = record.header
+
+    itemCount = reader.read_int("ItemCount: %s") # Number of blocks in the record
+    mainFlag = reader.read_flag('mainFlag', "MainFlag: %s")
+
+    # HEADER BLOCK
+    # ------------
+    if mainFlag & 0x01:
+        headerFlag = reader.read_flag('headerFlag', "HeaderFlag: %s") # Blocks in header
+        if headerFlag & 0x01:
+            header.append(('rn', reader.read_str("Header record name: %s").replace('_','')))  # Remove character '_' from index
+        if headerFlag & 0x02:
+            header.append(('va', reader.read_str("Header variant: %s")))
+        if headerFlag & 0x04:
+            s = reader.read_int("Header wordclass: %s")
+            if s < 32:
+                header.append(('wc', wordclass[s]))
+            else:
+                raise "Header wordclass out of range in: %s" % header
+        if headerFlag & 0x08:
+            header.append(('pa', reader.read_str("Header parts: %s")))
+        if headerFlag & 0x10:
+            header.append(('fo', reader.read_str("Header forms: %s")))
+        if headerFlag & 0x20:
+            header.append(('on', reader.read_str("Header origin note: %s")))
+        if headerFlag & 0x80:
+            header.append(('pr', pronunciation_encode(reader.read_str("Header pronunciation: %s"), dictionary)))
+
+    if headerOnly:
+        return record
+
+    # Header data block
+    if mainFlag & 0x02:
+        headerFlag = reader.read_flag('headerDataFlag', "Header headerFlag: %s") # Blocks in header
+        if headerFlag & 0x01:
+            header.append(('hs', reader.read_str("Header source: %s")))
+        if headerFlag & 0x02:
+            header.append(('dv', reader.read_str("Header dataVariant: %s")))
+        if headerFlag & 0x08:
+            header.append(('ex', reader.read_str("Example: %s")))
+        if headerFlag & 0x10:
+            header.append(('sh', reader.read_str("Header shortcut: %s")))
+        if headerFlag & 0x40:
+            header.append(('pv', reader.read_str("Plural variant: %s")))
+
+    # ??? Link elsewhere
+    pass
+
+    # SOUND DATA REFERENCE
+    if mainFlag & 0x80:
+       reader.read_int("Sound reference byte #1: %s")
+       reader.read_int("Sound reference byte #2: %s")
+       reader.read_int("Sound reference byte #3: %s")
+       reader.read_int("Sound reference byte #4: %s")
+       if reader.read_int("Sound reference continue: %s") & 0x80:
+          reader.read_int("Sound reference byte #5: %s")
+          reader.read_int("Sound reference byte #6: %s")
+          reader.read_int("Sound reference byte #7: %s")
+          reader.read_int("Sound reference byte #8: %s")
+
+    # TODO: Test all mainFlags in header!!!!
+
+    #result += ': '
+    li = 0
+ 
+    #print just every first word class identifier
+    # TODO: this is not systematic (should be handled by output)
+    lastWordClass = 0
+
+    # DATA BLOCK(S)
+    # -------------
+    for i in range(0, itemCount):
+        lead = []
+        item = []
+        ol = False
+        dataFlag = reader.read_flag('dataFlag', "DataFlag #%i: %%s -----------------------------") # block number is filled in by TracingReader
+        if dataFlag & 0x01: # small index
+            sampleFlag = reader.read_flag('sampleFlag', "Data sampleFlag: %s")
+            if sampleFlag & 0x01:
+                lead.append(('sa', reader.read_str("Data sample: %s")))
+            if sampleFlag & 0x02:
+                lead.append(('sa', reader.read_str("Data sample variant: %s")))
+            if sampleFlag & 0x04:
+               s = reader.read_int("Data wordclass: %s")
+               if s != lastWordClass: 
+                  if s < 32:
+                      lead.append(('wc', wordclass[s]))
+                  else:
+                      raise "Header wordclass out of range in: %s" % header
+               lastWordClass = s
+            if sampleFlag & 0x08:
+                lead.append(('sw', reader.read_str("Data sample wordclass: %s")))
+            if sampleFlag & 0x10:
+                reader.read_int("Data sample Int: %s")
+                reader.read_int("Data sample Int: %s")
+                reader.read_int("Data sample Int: %s")
+            if sampleFlag & 0x20:
+                item.append(('do', reader.read_str("Data origin note: %s")))
+            if sampleFlag & 0x80:
+                item.append((None, "    "))
+                lead.append(('pr', pronunciation_encode(reader.read_str("Data sample pronunciation: %s"), dictionary)))
+        if dataFlag & 0x02:
+            item.append((None, "    "))
+            subFlag = reader.read_flag('subFlag', "Data subFlag: %s")
+            if subFlag & 0x08:
+                item.append(('du', reader.read_str("Data sub example: %s")))
+            if subFlag & 0x10:
+                item.append(('dc', reader.read_str("Data sub shortcut: %s")))
+            if subFlag & 0x80:
+                reader.read_str("Data sub prefix: %s")
+                # It seams that data sub prefix content is ignored and there is a generated number for the whole block instead.
+                li += 1
+                ol = True
+        if dataFlag & 0x04: # chart
+            pass # ???
+        if dataFlag & 0x08: # reference
+            item.append(('df', reader.read_str("Data definition: %s")))
+        if dataFlag & 0x10: # note???
+            noteFlag = reader.read_flag('noteFlag', "Data noteFlag: %s");
+            if noteFlag & 0x01:
+                item.append(('nt', reader.read_str("Data note 0x01: %s")))
+            if noteFlag & 0x02:
+                noteCount = reader.read_int("Data noteCount: %s")
+                for i in range(0, noteCount):
+                   item.append(('nt', reader.read_str("Data note 0x02: %s")))
+            if noteFlag & 0x08:
+                noteCount = reader.read_int("Data noteCount: %s")
+                for i in range(0, noteCount):
+                   item.append(('nt', reader.read_str("Data note 0x08: %s")))
+            if noteFlag & 0x40:
+                item.append(('nt', reader.read_str("Data note 0x40: %s")))
+        if dataFlag & 0x20: # phrase
+            phraseFlag1 = reader.read_flag('phraseFlag1', "Data phraseFlag1: %s")
+            if phraseFlag1 & 0x01:
+                item.append(('ps', reader.read_str("Data phrase short form: %s")))
+            if phraseFlag1 & 0x02:
+                phraseCount = reader.read_int("Data phraseCount: %s")
+                for i in range(0, phraseCount):
+                    phraseComment = reader.read_int("Data phrase prefix")
+                    if phraseComment & 0x04:
+                       item.append(('pc', reader.read_str("Data phrase comment: %s")))
+                    item.append(('p1', reader.read_str("Data phrase 1: %s")))
+                    item.append(('p2', reader.read_str("Data phrase 2: %s")))
+            if phraseFlag1 & 0x04:
+                phraseCount = reader.read_int("Data phraseCount: %s")
+                for i in range(0, phraseCount):
+                    phraseComment = reader.read_int("Data phrase prefix")
+                    if phraseComment & 0x04:
+                       item.append(('pc', reader.read_str("Data phrase 1: %s")))
+                    item.append(('pg', reader.read_str("Data phrase comment: %s")))
+                    item.append(('p2', reader.read_str("Data phrase 2: %s")))
+            if phraseFlag1 & 0x08:
+                phraseCount = reader.read_int("Data simple phraseCount: %s")
+                for i in range(0, phraseCount):
+                    item.append(('sp', reader.read_str("Data simple phrase: %s")))
+            if phraseFlag1 & 0x10:
+                if dictionary.smallIndex: # different behaviour in small and big dictionaries
+                   item.append(('ps', reader.read_str("Data phrase short form: %s")))
+                else:
+                   phraseCount = reader.read_int("Data phraseCount: %s")
+                   for i in range(0, phraseCount):
+                      item.append(('ps', reader.read_str("Data phrase short form: %s")))
+            if phraseFlag1 & 0x40:
+                item.append(('ps', reader.read_str("Data phrase short form: %s")))
+
+
+            # TODO: be careful in changing the rules, to have back compatibility! 
+        if dataFlag & 0x40: # reference, related language
+            referenceFlag = reader.read_flag('referenceFlag', "Data referenceFlag: %s")
+            if referenceFlag & 0x01:
+                item.append(('rs', reader.read_str("Reference synonym: %s")))
+            if referenceFlag & 0x04: # lg_en-wn
+                item.append(('rr', reader.read_str("Reference hypernym: %s")))
+            if referenceFlag & 0x08: # lg_en-wn
+                item.append(('rp', reader.read_str("Reference hyponym: %s")))
+            #0x02 antonym ?
+        if dataFlag & 0x80: # Phrase block
+            flags = [
+            reader.read_int("Data phrase block: %s"),
+            reader.read_int("Data phrase block: %s"),
+            reader.read_int("Data phrase block: %s"),
+            reader.read_int("Data phrase block: %s"),
+            reader.read_int("Data phrase block: %s"),
+            reader.read_int("Data phrase block: %s"),
+            reader.read_int("Data phrase block: %s"),
+            reader.read_int("Data phrase block: %s")]
+            if flags == [0x80,0x80,0xF9,0xDF,0x9D,0x00,0x0B,0x01]:
+                lead.append((None, "\\nphr: "))
+                li = 1
+                ol = True
+                item.append(('b1', reader.read_str("Data phrase 1: %s")))
+                reader.read_int("Data phrase block: %s")
+                reader.read_int("Data phrase block: %s")
+                reader.read_int("Data phrase block: %s")
+                reader.read_int("Data phrase block: %s")
+                item.append(('b2', reader.read_str("Data phrase 2: %s")))
+            if flags == [0x80,0x80,0xF9,0xDF,0x9D,0x00,0x23,0x01]:
+                lead.append((None, "\\nphr: "))
+                li = 1
+                ol = True
+                item.append(('b1', reader.read_str("Data phrase 1: %s")))
+                reader.read_int("Data phrase block: %s")
+                reader.read_int("Data phrase block: %s")
+                reader.read_int("Data phrase block: %s")
+                reader.read_int("Data phrase block: %s")
+                reader.read_int("Data phrase block: %s")
+                item.append(('b2', reader.read_str("Data phrase 2: %s")))
+        record.blocks.append(DataBlock(lead, item, li if ol else 0))
+
+    record.end = reader.pos
+    ok = True
+    length = len(reader.bs)
+    if (length != 13752) and (length != 21988) and (length != 16204) and (length != 12656): #hack to workaround bug in some dicts (lg_czen-eco, lg_encz-ind, lg_czgr-eco, lg_grsk-2)
+       while reader.pos < length:
+           ok = (reader.read_int() == 0x00) and ok
+
+    record.complete = ok
+    return record
+
+def format_fields(fields, tag):
+    """Join fields of record enclosed by tags of output style"""
+    return ''.join([text if key is None else tag[key][0] + text + tag[key][1] for key, text in fields])
+
+def format_record(record, tag):
+    """Join header and data blocks of record enclosed by tags of output style, inline tags are left as they are"""
+    result = format_fields(record.header, tag)
+    for block in record.blocks:
+        result += format_fields(block.lead, tag)
+        item = tag['db'][0] + tag['db'][1] + format_fields(block.item, tag)
+        if block.number:
+            result += "\\n%d. %s" % (block.number, item)
+        else:
+            result += item
+    if record.complete:
+        result += '\n'
+    return result
+
+def render_text(record, outStyle, headerOnly = False):
+    """Format record for tab file in output style 0 (plain), 1 (\\n tags) or 2 (HTML)
+
+    With headerOnly just the header block is formatted, without tag postprocessing"""
+    if headerOnly:
+        return format_fields(record.header, tags[outStyle])
+    return decode_tag_postprocessing(format_record(record, tags[outStyle]), outStyle)
+
+def render_json(record):
+    """Format record as one line of JSON, text of fields without tags of any output style, inline tags in ( )"""
+    fields = lambda fields: [[key, decode_tag_postprocessing(text, 0)] for key, text in fields if key is not None]
+    blocks = [{'number': block.number, 'lead': fields(block.lead), 'item': fields(block.item)} for block in record.blocks]
+    return json.dumps({'header': fields(record.header), 'blocks': blocks, 'complete': record.complete}) + '\n'
+
+# Renderers of output formats, styles 0, 1, 2 and 'json'
+renderers = {
+    0: lambda record: render_text(record, 0),
+    1: lambda record: render_text(record, 1),
+    2: lambda record: render_text(record, 2),
+    'json': render_json,
+}
+
+def decode(reader, dictionary, headerOnly = False):
+    """Decode byte stream of one record, return decoded string with formatting in utf
+
+    With headerOnly just the header block is decoded and returned without tag postprocessing"""
+    return render_text(parse(reader, dictionary, headerOnly), dictionary.outStyle, headerOnly)
+
+def read_index(f, indexPos, indexBaseCount, indexOffsetCount, bodyPos, smallIndex):
+    """Decode index structure of file, return positions of records as compact array of uint32"""
+    f.seek(indexPos)
+    bases = unpack("<%sL" % indexBaseCount, f.read(indexBaseCount * 4))
+    if smallIndex: # In small dictionaries every base is used 4-times
+        step = 4 * 64
+    else:
+        step = 64
+    # all offsets in one read, 64 offsets for every base
+    offsets = array('H')
+    offsets.fromstring(f.read(len(bases) * step * 2))
+    if sys.byteorder == 'big':
+        offsets.byteswap()
+    index = array('I')
+    for k, b in enumerate(bases):
+        start = bodyPos + b
+        #print "Index %s: %s + %s + %s * 4" % (k * step, bodyPos, b, offsets[k * step])
+        index.extend([start + o * 4 for o in offsets[k * step:(k + 1) * step]])
+    del index[indexOffsetCount:]
+    return index
+
+# Index cache (sidecar file DICTIONARY.trd.idx):
+# header - magic, copyright block, size and mtime of the .trd file, entryCount, smallIndex, bodyPos,
+#          decoder version, number of index entries, number of headword entries, number of sorted headword entries
+# then index positions, headword positions and numbers of records sorted by headword
+# as little-endian uint32 arrays
+INDEXCACHEMAGIC = "LTRDIDX3"
+INDEXCACHEHEADER = "<8s64sQdLLL16sLLL"
+
+class MappedArray(object):
+    """Read-only little-endian uint32 array in memory mapped file"""
+    __slots__ = ('mapping', 'offset', 'length')
+
+    def __init__(self, mapping, offset, length):
+        self.mapping = mapping
+        self.offset = offset
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, n):
+        if n < 0 or n >= self.length:
+            raise IndexError("MappedArray index out of range")
+        return unpack_from("<L", self.mapping, self.offset + 4 * n)[0]
+
+def headword_offset(body, index, n):
+    """Get position of header record name of record of given number, 0 if it has no record name"""
+    p = index[n]
+    # itemCount, mainFlag & 0x01, headerFlag & 0x01, record name
+    if n + 1 < len(index) and index[n+1] - p > 3 and ord(body[p+1]) & 0x01 and ord(body[p+2]) & 0x01:
+        return p + 3
+    return 0
+
+def headword_offsets(body, index, entryCount):
+    """Get positions of header record names of all records, 0 for records without it"""
+    return array('I', [headword_offset(body, index, n) for n in range(0, entryCount)])
+
+def read_index_cache(path, copyright, stat):
+    """Load parameters, index and headword positions from sidecar file, None if it is missing or outdated"""
+    try:
+        cache = open(path, 'rb')
+    except IOError:
+        return None
+    try:
+        mapping = mmap.mmap(cache.fileno(), 0, access=mmap.ACCESS_READ)
+    except (mmap.error, ValueError): # ValueError for empty file
+        return None
+    finally:
+        cache.close()
+    size = calcsize(INDEXCACHEHEADER)
+    if len(mapping) < size:
+        return None
+    magic, cachedCopyright, fileSize, mtime, entryCount, smallIndex, bodyPos, version, indexCount, headwordCount, orderCount = unpack_from(INDEXCACHEHEADER, mapping)
+    if magic != INDEXCACHEMAGIC or cachedCopyright != copyright or fileSize != stat.st_size or mtime != stat.st_mtime:
+        return None
+    if version != decoder_version(): # order of headwords depends on translation tables
+        return None
+    if len(mapping) != size + 4 * (indexCount + headwordCount + orderCount):
+        return None
+    return ((entryCount, bool(smallIndex), bodyPos), MappedArray(mapping, size, indexCount), MappedArray(mapping, size + 4 * indexCount, headwordCount),
+            MappedArray(mapping, size + 4 * (indexCount + headwordCount), orderCount))
+
+def write_index_cache(path, copyright, stat, params, index, headwords, order):
+    """Store parameters, index and headword positions and numbers of records sorted by headword into sidecar file"""
+    entryCount, smallIndex, bodyPos = params
+    tmp = path + '.tmp'
+    cache = open(tmp, 'wb')
+    cache.write(pack(INDEXCACHEHEADER, INDEXCACHEMAGIC, copyright, stat.st_size, stat.st_mtime, entryCount, smallIndex, bodyPos, decoder_version(), len(index), len(headwords), len(order)))
+    for positions in (index, headwords, order):
+        positions = array('I', positions)
+        if sys.byteorder == 'big':
+            positions.byteswap()
+        cache.write(positions.tostring())
+    cache.close()
+    os.rename(tmp, path)
+
+# Record hashes (sidecar file OUTPUT.rh) for incremental conversion:
+# header - magic, decoder version, output style, smallIndex, size and mtime of the output file, number of records
+# then for every decoded record md5 of record data, position and length of the record in the output file
+RECORDHASHMAGIC = "LTRDRH02"
+RECORDHASHHEADER = "<8s16sBBQdL"
+RECORDHASH = "<16sQL"
+
+# Version of parse() and formatting of records, has to be increased by every change
+# of decoded text not made in translation and tag tables
+DECODERVERSION = 1
+
+def record_hash(stream):
+    """Hash of raw data of record"""
+    return hashlib.md5(stream).digest()
+
+def decoder_version():
+    """Hash of DECODERVERSION and translation and tag tables, text decoded by other version differs"""
+    tables = [DECODERVERSION, tags, alphaSmall, upcaseSmall, alphaLarge, upcaseLarge, upcase_pron,
+              symbol, special, wordclass, subs, inlineTagLetters, inlineTags]
+    return hashlib.md5(json.dumps(tables, sort_keys=True)).digest()
+
+def read_record_hashes(path, outStyle, smallIndex, stat):
+    """Load positions of decoded records in output file by hash of record data
+
+    None if sidecar file is missing, outdated or written by other version of decoder"""
+    try:
+        data = open(path, 'rb').read()
+    except IOError:
+        return None
+    size = calcsize(RECORDHASHHEADER)
+    if len(data) < size:
+        return None
+    magic, version, style, small, fileSize, mtime, count = unpack_from(RECORDHASHHEADER, data)
+    if magic != RECORDHASHMAGIC or version != decoder_version() or style != outStyle or small != smallIndex or fileSize != stat.st_size or mtime != stat.st_mtime:
+        return None
+    entrySize = calcsize(RECORDHASH)
+    if len(data) != size + count * entrySize:
+        return None
+    hashes = {}
+    for p in xrange(size, len(data), entrySize):
+        h, offset, length = unpack_from(RECORDHASH, data, p)
+        hashes[h] = (offset, length)
+    return hashes
+
+def write_record_hashes(path, outStyle, smallIndex, stat, records):
+    """Store hashes and positions (hash, offset, length) of decoded records of output file into sidecar file"""
+    tmp = path + '.tmp'
+    sidecar = OutputBuffer(open(tmp, 'wb'))
+    sidecar.write(pack(RECORDHASHHEADER, RECORDHASHMAGIC, decoder_version(), outStyle, smallIndex, stat.st_size, stat.st_mtime, len(records)))
+    for record in records:
+        sidecar.write(pack(RECORDHASH, *record))
+    sidecar.close()
+    os.rename(tmp, path)
+
+# Inline tags of output style 2 rewritten back to style 0, longest first
+style2Tags = sorted(set([(prefix, inlineTags[0][letter][0]) for letter, (prefix, suffix) in inlineTags[2].items()] +
+                        [(suffix, inlineTags[0][letter][1]) for letter, (prefix, suffix) in inlineTags[2].items()]),
+                   key=lambda (tag, plain): len(tag), reverse=True)
+
+def headword_key(word):
+    """Key of headword in HeadwordIndex: inline tags rewritten as in output style 0 (and 1)
+
+    Headwords printed by -n or converted in any output style have the same key as the record name."""
+    if '<' in word:
+        word = decode_tag_postprocessing(word, 0)
+        for tag, plain in style2Tags:
+            word = word.replace(tag, plain)
+    return word
+
+def headword_pairs(dictionary):
+    """Get sorted pairs (headword key, record number) of records with headword"""
+    pairs = []
+    for n in range(1, dictionary.entryCount):
+        word = dictionary.getHeadword(n)
+        if word is not None:
+            pairs.append((headword_key(word), n))
+    pairs.sort()
+    return pairs
+
+def headword_order(dictionary):
+    """Get numbers of records with headword sorted by headword key"""
+    return array('I', [n for word, n in headword_pairs(dictionary)])
+
+class SortedHeadwords(object):
+    """Headword keys of records in given order, decoded on access, for binary search without decoding all records"""
+    __slots__ = ('dictionary', 'records')
+
+    def __init__(self, dictionary, records):
+        self.dictionary = dictionary
+        self.records = records
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, k):
+        return headword_key(self.dictionary.getHeadword(self.records[k]))
+
+class HeadwordIndex(object):
+    """Sorted headword keys of records for exact and prefix lookup by binary search
+
+    With index cache the sorted order of records is memory mapped and just the
+    headwords visited by the binary search are decoded."""
+    __slots__ = ('words', 'records')
+
+    def __init__(self, dictionary):
+        if dictionary.headwordOrder is not None:
+            self.records = dictionary.headwordOrder
+            self.words = SortedHeadwords(dictionary, self.records)
+        else:
+            pairs = headword_pairs(dictionary)
+            self.words = [word for word, n in pairs]
+            self.records = array('I', [n for word, n in pairs])
+
+    def find(self, word, prefix = False):
+        """Get numbers of records with given headword or headword prefix, compared by headword_key()"""
+        word = headword_key(word)
+        lo = bisect.bisect_left(self.words, word)
+        if prefix:
+            hi = bisect.bisect_left(self.words, word + '\xff', lo) # '\xff' never occurs in utf-8
+        else:
+            hi = bisect.bisect_right(self.words, word, lo)
+        return [self.records[k] for k in range(lo, hi)]
+
+# Memory used by decoded records in RecordCache
+RECORDCACHEBUDGET = 64 << 20
+# Estimated memory used by cache entry besides the decoded string: key, ordered dict node
+RECORDCACHEOVERHEAD = 200
+
+class RecordCache(object):
+    """Least recently used decoded records limited by size in bytes, keyed by (file identity, record number, output style)"""
+    __slots__ = ('budget', 'size', 'entries', 'hits', 'misses', 'evictions')
+
+    def __init__(self, budget = RECORDCACHEBUDGET):
+        self.budget = budget
+        self.size = 0
+        self.entries = collections.OrderedDict() # least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Get decoded record and mark it as recently used, None if it is not cached"""
+        s = self.entries.pop(key, None)
+        if s is None:
+            self.misses += 1
+            return None
+        self.entries[key] = s
+        self.hits += 1
+        return s
+
+    def put(self, key, s):
+        """Store decoded record, evict least recently used records over budget"""
+        size = len(s) + RECORDCACHEOVERHEAD
+        if size > self.budget:
+            return
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.size -= len(old) + RECORDCACHEOVERHEAD
+        self.entries[key] = s
+        self.size += size
+        while self.size > self.budget:
+            key, old = self.entries.popitem(last=False)
+            self.size -= len(old) + RECORDCACHEOVERHEAD
+            self.evictions += 1
+
+    def stats(self):
+        """Counters of cache as dictionary"""
+        return {'entries': len(self.entries), 'size': self.size, 'budget': self.budget,
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+class RecordStructureError(Exception):
+    """Record does not match known structure of records"""
+
+def iter_entries(path, style = 2, indexCache = False):
+    """Generate (record number, headword, definition) for all records of dictionary file
+
+    Records are decoded lazily one after another. RecordStructureError is raised at the
+    first record which does not match known structure of records."""
+    for entry in entries(Dictionary(path, style, indexCache)):
+        yield entry
+
+def entries(dictionary):
+    """Generate (record number, headword, definition) for all records of opened dictionary"""
+    separator = dictionary.tag['rn'][1]
+    for i in xrange(1, dictionary.entryCount):
+        s = decode(dictionary.reader(dictionary.getRec(i), dictionary), dictionary)
+        if not s.endswith('\n'):
+            raise RecordStructureError("Record %s: %s" % (i, s))
+        headword, definition = split_record(s[:-1], separator)
+        yield i, headword, definition
+
+def split_record(s, separator):
+    """Split decoded record without the trailing newline into headword and definition by separator of record name"""
+    if separator in s:
+        headword, definition = s.split(separator, 1)
+        return headword, definition
+    return '', s
+
+# Output is written to the file in blocks of at least this size
+OUTPUTBUFFER = 1 << 20
+
+class OutputBuffer(object):
+    """Collect decoded (utf-8) strings and write them to the file in large blocks"""
+    __slots__ = ('file', 'parts', 'size', 'limit')
+
+    def __init__(self, file, limit = OUTPUTBUFFER):
+        self.file = file
+        self.parts = []
+        self.size = 0
+        self.limit = limit
+
+    def write(self, s):
+        self.parts.append(s)
+        self.size += len(s)
+        if self.size >= self.limit:
+            self.flush()
+
+    def writelines(self, strings):
+        for s in strings:
+            self.write(s)
+
+    def flush(self):
+        """Write collected strings by one call"""
+        if self.parts:
+            self.file.write(''.join(self.parts))
+            self.parts = []
+            self.size = 0
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        if self.file is not sys.stdout:
+            self.file.close()
+
+# StarDict dictionary (.ifo, .idx, .dict or .dict.dz) written without stardict-tools tabfile
+# Number of index entries sorted in memory, longer index is sorted by merging sorted runs on disk
+STARDICTRUN = 100000
+# Size of uncompressed block of dictzip file
+DICTZIPCHUNK = 58315
+
+# Escapes of tab file format, unescaped the same way as by tabfile
+re_tab_escape = re.compile(r'\\([nt\\])')
+tabEscapes = {'n': '\n', 't': '\t', '\\': '\\'}
+
+def stardict_key(word):
+    """Sort key of StarDict index: ASCII case insensitive order, then byte order"""
+    return (word.lower(), word)
+
+def write_run(entries):
+    """Write sorted run of index entries (key, word, offset, size) to temporary file"""
+    run = tempfile.TemporaryFile()
+    for key, word, offset, size in entries:
+        run.write(pack("<HLL", len(word), offset, size) + word)
+    run.seek(0)
+    return run
+
+def read_run(run):
+    """Generate index entries (key, word, offset, size) of sorted run"""
+    while True:
+        head = run.read(10)
+        if not head:
+            break
+        length, offset, size = unpack("<HLL", head)
+        word = run.read(length)
+        yield stardict_key(word), word, offset, size
+    run.close()
+
+def write_dictzip(path, dictPath):
+    """Compress .dict file to dictzip format: gzip with random access to chunks of DICTZIPCHUNK bytes"""
+    chunks = tempfile.TemporaryFile()
+    sizes = []
+    crc = 0
+    length = 0
+    data = open(dictPath, 'rb')
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+    block = data.read(DICTZIPCHUNK)
+    while block:
+        crc = zlib.crc32(block, crc)
+        length += len(block)
+        nextBlock = data.read(DICTZIPCHUNK)
+        if nextBlock:
+            z = compressor.compress(block) + compressor.flush(zlib.Z_FULL_FLUSH)
+        else:
+            z = compressor.compress(block) + compressor.flush(zlib.Z_FINISH)
+        sizes.append(len(z))
+        chunks.write(z)
+        block = nextBlock
+    data.close()
+    if not sizes:
+        z = compressor.flush(zlib.Z_FINISH)
+        sizes.append(len(z))
+        chunks.write(z)
+    # random access subfield "RA": version, chunk length, chunk count, compressed sizes of chunks
+    extra = pack("<2sHHHH%sH" % len(sizes), 'RA', 6 + 2 * len(sizes), 1, DICTZIPCHUNK, len(sizes), *sizes)
+    dz = open(path, 'wb')
+    dz.write(pack("<BBBBLBBH", 0x1f, 0x8b, 8, 4, int(time.time()), 2, 3, len(extra)) + extra)
+    chunks.seek(0)
+    block = chunks.read(OUTPUTBUFFER)
+    while block:
+        dz.write(block)
+        block = chunks.read(OUTPUTBUFFER)
+    chunks.close()
+    dz.write(pack("<LL", crc & 0xffffffff, length & 0xffffffff))
+    dz.close()
+
+def write_stardict(base, entries, style = 2, dictzip = False, bookname = None):
+    """Write entries (record number, headword, definition) as StarDict dictionary base.ifo, base.idx, base.dict(.dz)
+
+    Definitions are written to .dict in the order of records, index entries are sorted in runs
+    of STARDICTRUN entries and the runs are merged into .idx. Return number of written words.
+    Definitions are written to temporary file renamed at the end, no partial .dict is left on error."""
+    dictPath = base + '.dict'
+    tmp = dictPath + '.tmp'
+    data = OutputBuffer(open(tmp, 'wb'))
+    offset = 0
+    runs = []
+    run = []
+    try:
+        for n, headword, definition in entries:
+            word = headword.strip()
+            if not word or len(word) >= 256: # StarDict limit of word length
+                continue
+            definition = re_tab_escape.sub(lambda m: tabEscapes[m.group(1)], definition)
+            data.write(definition)
+            run.append((stardict_key(word), word, offset, len(definition)))
+            offset += len(definition)
+            if len(run) >= STARDICTRUN:
+                run.sort()
+                runs.append(write_run(run))
+                run = []
+        data.close()
+        if dictzip:
+            write_dictzip(dictPath + '.dz', tmp)
+            os.remove(tmp)
+        else:
+            os.rename(tmp, dictPath)
+    except:
+        data.file.close()
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    run.sort()
+    if runs:
+        runs.append(write_run(run))
+        sortedEntries = heapq.merge(*[read_run(r) for r in runs])
+    else:
+        sortedEntries = run
+
+    idx = OutputBuffer(open(base + '.idx', 'wb'))
+    wordCount = 0
+    idxSize = 0
+    for key, word, offset, size in sortedEntries:
+        entry = word + '\x00' + pack(">LL", offset, size)
+        idx.write(entry)
+        idxSize += len(entry)
+        wordCount += 1
+    idx.close()
+
+    if style == 2:
+        sameTypeSequence = 'g' # Pango markup
+    else:
+        sameTypeSequence = 'm' # plain text
+    ifo = open(base + '.ifo', 'wb')
+    ifo.write("StarDict's dict ifo file\n")
+    ifo.write("version=2.4.2\n")
+    ifo.write("bookname=%s\n" % (bookname or os.path.basename(base)))
+    ifo.write("wordcount=%s\n" % wordCount)
+    ifo.write("idxfilesize=%s\n" % idxSize)
+    ifo.write("sametypesequence=%s\n" % sameTypeSequence)
+    ifo.close()
+    return wordCount
+
+# Functions and methods timed by Profile, times of nested stages are included in the outer ones
+profiledFunctions = ['parse', 'render_text', 'decode_alpha_groups', 'decode_alpha_postprocessing',
+                     'pronunciation_encode', 'decode_tag_postprocessing']
+profiledMethods = [('Dictionary', 'getRec'), ('OutputBuffer', 'flush')]
+
+def count_bits(counts, bits):
+    """Count every set bit of bits in counts[bit]"""
+    bit = 1
+    while bit <= bits:
+        if bits & bit:
+            counts[bit] += 1
+        bit <<= 1
+
+def bit_histogram(counts):
+    """Counts of bits with hex keys for JSON"""
+    return dict([("0x%02x" % bit, n) for bit, n in counts.items()])
+
+class Profile(object):
+    """Cumulative time and number of calls of decoding stages, histograms of record sizes and flag bits
+
+    Stages are timed by wrappers installed by enable() and removed by disable(), so decoding
+    is not slowed down without profiling. Set bits of flags are counted by records read by
+    reader(), the factory of record readers given to Dictionary."""
+
+    def __init__(self):
+        self.times = collections.defaultdict(float)
+        self.calls = collections.defaultdict(int)
+        self.sizes = collections.defaultdict(int)
+        self.flags = collections.defaultdict(lambda: collections.defaultdict(int))
+        self.originals = []
+
+    def timed(self, name, function):
+        """Wrap function to add its time and call to the stage of given name"""
+        times = self.times
+        calls = self.calls
+        clock = time.time
+        def wrapper(*args):
+            start = clock()
+            try:
+                return function(*args)
+            finally:
+                times[name] += clock() - start
+                calls[name] += 1
+        return wrapper
+
+    def enable(self):
+        """Install timing wrappers of stages
+
+        Functions imported into the main script by from lingea_trd import * are wrapped there too."""
+        module = sys.modules[__name__]
+        main = sys.modules.get('__main__')
+        for name in profiledFunctions:
+            function = getattr(module, name)
+            wrapper = self.timed(name, function)
+            self.originals.append((module, name, function))
+            setattr(module, name, wrapper)
+            if main is not None and main is not module and getattr(main, name, None) is function:
+                self.originals.append((main, name, function))
+                setattr(main, name, wrapper)
+        for className, name in profiledMethods:
+            cls = getattr(module, className)
+            function = cls.__dict__[name]
+            self.originals.append((cls, name, function))
+            setattr(cls, name, self.timed(className + '.' + name, function))
+
+    def disable(self):
+        """Remove timing wrappers"""
+        while self.originals:
+            target, name, function = self.originals.pop()
+            setattr(target, name, function)
+
+    def reader(self, stream, dictionary):
+        """RecordReader counting size of record and flags for histograms"""
+        self.sizes[1 << len(stream).bit_length() >> 1] += 1
+        return ProfilingReader(self, stream, dictionary)
+
+    def stats(self):
+        """Collected data as dictionary ready for JSON"""
+        stages = dict([(name, {'seconds': self.times[name], 'calls': self.calls[name]}) for name in self.calls])
+        return {'stages': stages,
+                'recordSizes': dict([(str(size), n) for size, n in self.sizes.items()]), # size rounded down to power of 2
+                'flags': dict([(name, bit_histogram(counts)) for name, counts in self.flags.items()])}
+
+class ProfilingReader(RecordReader):
+    """RecordReader counting set bits of flags in Profile"""
+    __slots__ = ('profile',)
+
+    def __init__(self, profile, stream, dictionary):
+        RecordReader.__init__(self, stream, dictionary)
+        self.profile = profile
+
+    def read_flag(self, name, comment = ""):
+        value = RecordReader.read_flag(self, name, comment)
+        count_bits(self.profile.flags[name], value)
+        return value
+
+# Flag bits handled by parse(), mask of handled bits by name of flag given to read_flag()
+handledFlags = {
+    'mainFlag': 0x83,
+    'headerFlag': 0xbf,
+    'headerDataFlag': 0x5b,
+    'dataFlag': 0xfb, # 0x04 chart is skipped
+    'sampleFlag': 0xbf,
+    'subFlag': 0x98,
+    'noteFlag': 0x4b,
+    'phraseFlag1': 0x5f,
+    'referenceFlag': 0x0d,
+}
+
+# Placeholders of symbols missing in translation tables
+re_placeholder = re.compile(r'#(?:AL|UP|SY|SP)[^#\s]{1,8}#')
+
+class FlagReader(RecordReader):
+    """RecordReader counting flag bits not handled by parse() in unhandled[name of flag][bit]"""
+    __slots__ = ('unhandled',)
+
+    def __init__(self, stream, dictionary, unhandled):
+        RecordReader.__init__(self, stream, dictionary)
+        self.unhandled = unhandled
+
+    def read_flag(self, name, comment = ""):
+        value = RecordReader.read_flag(self, name, comment)
+        if name in handledFlags:
+            bits = value & ~handledFlags[name]
+            if bits:
+                count_bits(self.unhandled.setdefault(name, collections.defaultdict(int)), bits)
+        return value
+
+def record_texts(record):
+    """All texts of fields of record"""
+    texts = [text for key, text in record.header]
+    for block in record.blocks:
+        texts.extend([text for key, text in block.lead])
+        texts.extend([text for key, text in block.item])
+    return texts
+
+# Columnar export (file written by ColumnWriter, read by ColumnReader):
+# header - magic, number of entries, positions of headword offsets, headword blob,
+#          definition offsets, definition blob and sorted permutation of entries (0 if missing)
+# offsets are little-endian uint32 arrays of entries + 1 items, blobs are concatenated utf-8 texts,
+# permutation is uint32 array of entry numbers in byte order of headwords; sections are aligned to 8 bytes
+COLUMNSMAGIC = "LTRDCOL1"
+COLUMNSHEADER = "<8sLQQQQQ"
+
+class ColumnWriter(object):
+    """Write entries (headword, definition) to columnar file, blobs are kept in temporary files until close()"""
+    __slots__ = ('path', 'blobs', 'offsets', 'words')
+
+    def __init__(self, path, sort = False):
+        self.path = path
+        self.blobs = (tempfile.TemporaryFile(), tempfile.TemporaryFile())
+        self.offsets = (array('I', [0]), array('I', [0]))
+        self.words = None
+        if sort:
+            self.words = []
+
+    def add(self, headword, definition):
+        for blob, offsets, text in zip(self.blobs, self.offsets, (headword, definition)):
+            blob.write(text)
+            offsets.append(offsets[-1] + len(text))
+        if self.words is not None:
+            self.words.append(headword)
+
+    def close(self):
+        """Write header, offsets, blobs and permutation, return number of entries"""
+        count = len(self.offsets[0]) - 1
+        sections = []
+        for blob, offsets in zip(self.blobs, self.offsets):
+            sections.append(offsets)
+            sections.append(blob)
+        if self.words is not None:
+            permutation = range(count)
+            permutation.sort(key=self.words.__getitem__)
+            sections.append(array('I', permutation))
+            self.words = None
+        positions = []
+        pos = calcsize(COLUMNSHEADER)
+        for section in sections:
+            pos += -pos % 8
+            positions.append(pos)
+            if isinstance(section, array):
+                pos += section.itemsize * len(section)
+            else:
+                pos += section.tell()
+        positions += [0] * (5 - len(positions))
+
+        tmp = self.path + '.tmp'
+        f = open(tmp, 'wb')
+        f.write(pack(COLUMNSHEADER, COLUMNSMAGIC, count, *positions))
+        for section in sections:
+            f.write('\x00' * (-f.tell() % 8))
+            if isinstance(section, array):
+                if sys.byteorder == 'big':
+                    section.byteswap()
+                f.write(section.tostring())
+            else:
+                section.seek(0)
+                block = section.read(OUTPUTBUFFER)
+                while block:
+                    f.write(block)
+                    block = section.read(OUTPUTBUFFER)
+                section.close()
+        f.close()
+        os.rename(tmp, self.path)
+        return count
+
+class ColumnReader(object):
+    """Memory mapped columnar file, zero-copy access to headwords and definitions of entries"""
+    __slots__ = ('mapping', 'count', 'headwordOffsets', 'headwordBlob', 'definitionOffsets', 'definitionBlob', 'permutation')
+
+    def __init__(self, path):
+        f = open(path, 'rb')
+        self.mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        f.close()
+        magic, self.count, headwordOffsets, self.headwordBlob, definitionOffsets, self.definitionBlob, permutation = unpack_from(COLUMNSHEADER, self.mapping)
+        if magic != COLUMNSMAGIC:
+            raise ValueError("%s is not columnar export of dictionary" % path)
+        self.headwordOffsets = MappedArray(self.mapping, headwordOffsets, self.count + 1)
+        self.definitionOffsets = MappedArray(self.mapping, definitionOffsets, self.count + 1)
+        self.permutation = None
+        if permutation:
+            self.permutation = MappedArray(self.mapping, permutation, self.count)
+
+    def __len__(self):
+        return self.count
+
+    def headword(self, n):
+        """Headword of entry as buffer of memory mapped file"""
+        start = self.headwordOffsets[n]
+        return buffer(self.mapping, self.headwordBlob + start, self.headwordOffsets[n+1] - start)
+
+    def definition(self, n):
+        """Definition of entry as buffer of memory mapped file"""
+        start = self.definitionOffsets[n]
+        return buffer(self.mapping, self.definitionBlob + start, self.definitionOffsets[n+1] - start)
+
+    def find(self, word):
+        """Get numbers of entries with given headword by binary search in sorted permutation"""
+        if self.permutation is None:
+            raise ValueError("columnar file has no sorted permutation of headwords")
+        permutation = self.permutation
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if str(self.headword(permutation[mid])) < word:
+                lo = mid + 1
+            else:
+                hi = mid
+        found = []
+        while lo < self.count and str(self.headword(permutation[lo])) == word:
+            found.append(permutation[lo])
+            lo += 1
+        return found
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+#
+# Encoder of synthetic Lingea Dictionary (.trd) files for benchmarks and checks
+#
+# Synthetic .trd files have the file format decoded by lingea_trd.py: 128 byte
+# header, index of bases and offsets and records of 6-bit packed strings using
+# every branch of parse(), in small and large variant. Used by
+# lingea-trd-benchmark.py and lingea-trd-check.py.
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Library General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+from lingea_trd import *
+import random
+
+class Alphabet(object):
+    """6-bit symbols of the alphabet of small or large dictionaries used by the encoder"""
+    __slots__ = ('smallIndex', 'letters', 'space', 'upcase', 'special', 'symbol', 'pron', 'accents', 'lt', 'gt', 'caret', 'capitals')
+
+    def __init__(self, smallIndex):
+        self.smallIndex = smallIndex
+        if smallIndex:
+            alpha, upcase = alphaSmall, upcaseSmall
+        else:
+            alpha, upcase = alphaLarge, upcaseLarge
+        self.letters = [alpha.index(c) for c in 'abcdefghijklmnopqrstuvwxyz']
+        self.space = alpha.index(' ')
+        self.upcase = alpha.index('#UPCASE#')
+        self.special = alpha.index('#SPECIAL#')
+        # combined symbols of large dictionaries
+        self.symbol = '#SYMBOL#' in alpha and alpha.index('#SYMBOL#')
+        self.pron = '#PRON#' in alpha and alpha.index('#PRON#')
+        self.accents = [k for k, c in enumerate(alpha) if c in subs and c not in ('#SYMBOL#', '#PRON#', '#SPECIAL#')]
+        # inline tags <x...>
+        if '<' in alpha:
+            self.lt, self.gt = [alpha.index('<')], [alpha.index('>')]
+        else:
+            self.lt, self.gt = [self.upcase, upcase.index('<')], [self.upcase, upcase.index('>')]
+        self.caret = [self.special, special.index('^')]
+        self.capitals = dict([(c, [self.upcase, upcase.index(c)]) for c in 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'])
+
+def random_symbols(r, alphabet, count):
+    """Random text of given number of letters, spaces and combined symbols"""
+    out = []
+    for k in range(count):
+        x = r.random()
+        if x < 0.6:
+            out.append(r.choice(alphabet.letters))
+        elif x < 0.7:
+            out.append(alphabet.space)
+        elif x < 0.8:
+            out.extend(alphabet.capitals[r.choice('ABCDEFGHIJKLMNOPQRSTUVWXYZ')])
+        elif x < 0.85:
+            out.extend([alphabet.special, r.randint(1, 63)])
+        elif alphabet.smallIndex:
+            out.append(r.choice(alphabet.letters))
+        elif x < 0.9:
+            out.extend([alphabet.symbol, r.randint(1, 63)])
+        elif x < 0.95:
+            out.extend([alphabet.pron, r.randint(1, 63), r.randint(1, 63)])
+        else:
+            out.extend([r.choice(alphabet.accents), r.randint(1, 63)])
+    return out
+
+def random_tag(r, alphabet):
+    """Random Lingea inline tag <x...>"""
+    letter = r.choice(inlineTagLetters)
+    if letter == '^':
+        symbols = alphabet.caret
+    elif letter.isupper():
+        symbols = alphabet.capitals[letter]
+    else:
+        symbols = [alphabet.letters[ord(letter) - ord('a')]]
+    return alphabet.lt + symbols + random_symbols(r, alphabet, r.randint(0, 5)) + alphabet.gt
+
+def encode_string(symbols):
+    """Pack 6-bit symbols terminated by NULL into bytes, 4 symbols in 3 bytes, bytes after the NULL are left out"""
+    end = len(symbols)
+    symbols = symbols + [0] * (4 - end % 4)
+    out = []
+    for g in range(0, len(symbols), 4):
+        v = (symbols[g] << 18) | (symbols[g+1] << 12) | (symbols[g+2] << 6) | symbols[g+3]
+        out.extend([v >> 16, (v >> 8) & 0xff, v & 0xff])
+    g, j = divmod(end, 4)
+    return out[:3 * g + min(j + 1, 3)]
+
+def random_string(r, alphabet, pron = False):
+    """Random encoded string, sometimes with inline tag, pronunciation ends with upcase symbol"""
+    symbols = random_symbols(r, alphabet, r.randint(0, 12))
+    if r.random() < 0.3:
+        symbols += random_tag(r, alphabet) + random_symbols(r, alphabet, r.randint(0, 4))
+    if pron:
+        symbols += alphabet.capitals[r.choice('ABCDEFGHIJKLMNOPQRSTUVWXYZ')]
+    return encode_string(symbols)
+
+# Flags of phrase blocks known by parse()
+phraseBlocks = [[0x80,0x80,0xF9,0xDF,0x9D,0x00,0x0B,0x01], [0x80,0x80,0xF9,0xDF,0x9D,0x00,0x23,0x01]]
+
+def random_record(r, alphabet):
+    """Random record using every flag known by parse()"""
+    out = []
+    S = lambda pron = False: out.extend(random_string(r, alphabet, pron))
+    I = out.append
+    def strings():
+        count = r.randint(0, 3)
+        I(count)
+        for k in range(count):
+            S()
+
+    itemCount = r.randint(0, 4)
+    mainFlag = r.choice([0x00, 0x01, 0x01, 0x01, 0x03, 0x81, 0x83])
+    I(itemCount)
+    I(mainFlag)
+    if mainFlag & 0x01:
+        headerFlag = r.randint(0, 255) & ~0x40
+        I(headerFlag)
+        for bit in (0x01, 0x02, 0x04, 0x08, 0x10, 0x20, 0x80):
+            if headerFlag & bit:
+                if bit == 0x04:
+                    I(r.randint(0, len(wordclass) - 1))
+                else:
+                    S(bit == 0x80)
+    if mainFlag & 0x02:
+        headerFlag = r.choice([0x00, 0x01, 0x02, 0x08, 0x10, 0x40, 0x5b])
+        I(headerFlag)
+        for bit in (0x01, 0x02, 0x08, 0x10, 0x40):
+            if headerFlag & bit:
+                S()
+    if mainFlag & 0x80:
+        for k in range(4):
+            I(r.randint(0, 255))
+        soundContinue = r.choice([0x00, 0x80])
+        I(soundContinue)
+        if soundContinue:
+            for k in range(4):
+                I(r.randint(0, 255))
+
+    for i in range(itemCount):
+        dataFlag = r.randint(0, 255)
+        I(dataFlag)
+        if dataFlag & 0x01:
+            sampleFlag = r.randint(0, 255) & ~0x40
+            I(sampleFlag)
+            for bit in (0x01, 0x02, 0x04, 0x08, 0x10, 0x20, 0x80):
+                if sampleFlag & bit:
+                    if bit == 0x04:
+                        I(r.randint(0, len(wordclass) - 1))
+                    elif bit == 0x10:
+                        out.extend([r.randint(0, 255) for k in range(3)])
+                    else:
+                        S(bit == 0x80)
+        if dataFlag & 0x02:
+            subFlag = r.choice([0x00, 0x08, 0x10, 0x80, 0x98])
+            I(subFlag)
+            for bit in (0x08, 0x10, 0x80):
+                if subFlag & bit:
+                    S()
+        if dataFlag & 0x08:
+            S()
+        if dataFlag & 0x10:
+            noteFlag = r.choice([0x00, 0x01, 0x02, 0x08, 0x40, 0x4b])
+            I(noteFlag)
+            if noteFlag & 0x01:
+                S()
+            if noteFlag & 0x02:
+                strings()
+            if noteFlag & 0x08:
+                strings()
+            if noteFlag & 0x40:
+                S()
+        if dataFlag & 0x20:
+            phraseFlag1 = r.randint(0, 127) & ~0x20
+            I(phraseFlag1)
+            if phraseFlag1 & 0x01:
+                S()
+            for bit in (0x02, 0x04):
+                if phraseFlag1 & bit:
+                    count = r.randint(0, 3)
+                    I(count)
+                    for k in range(count):
+                        phraseComment = r.choice([0x00, 0x04])
+                        I(phraseComment)
+                        if phraseComment & 0x04:
+                            S()
+                        S()
+                        S()
+            if phraseFlag1 & 0x08:
+                strings()
+            if phraseFlag1 & 0x10:
+                if alphabet.smallIndex:
+                    S()
+                else:
+                    strings()
+            if phraseFlag1 & 0x40:
+                S()
+        if dataFlag & 0x40:
+            referenceFlag = r.choice([0x00, 0x01, 0x04, 0x08, 0x0d])
+            I(referenceFlag)
+            for bit in (0x01, 0x04, 0x08):
+                if referenceFlag & bit:
+                    S()
+        if dataFlag & 0x80:
+            flags = r.choice(phraseBlocks + [[r.randint(0, 255) for k in range(8)]])
+            out.extend(flags)
+            if flags in phraseBlocks:
+                S()
+                out.extend([r.randint(0, 255) for k in range(4 + phraseBlocks.index(flags))])
+                S()
+    # records are aligned to 4 bytes by zeros, sometimes with more zeros
+    out.extend([0] * (-len(out) % 4))
+    if r.random() < 0.2:
+        out.extend([0] * 4)
+    return out
+
+def write_trd(path, records, smallIndex):
+    """Write records as .trd file: header, index of bases and offsets, records"""
+    positions = [0]
+    for record in records:
+        positions.append(positions[-1] + len(record))
+    # every base is followed by 64 offsets (4 * 64 in small dictionaries) in 4 byte units
+    if smallIndex:
+        step = 4 * 64
+    else:
+        step = 64
+    bases = positions[::step]
+    offsets = []
+    for k, base in enumerate(bases):
+        block = [(p - base) / 4 for p in positions[k * step:(k + 1) * step]]
+        offsets.extend(block + [0] * (step - len(block)))
+    indexPos = 128
+    index = pack("<%sL" % len(bases), *bases) + pack("<%sH" % len(offsets), *offsets)
+    a = [0] * 16
+    a[3] = smallIndex and 2052 or 1
+    a[4] = len(records)
+    a[6] = len(bases)
+    a[7] = len(positions)
+    a[9] = indexPos
+    a[10] = indexPos + len(index)
+    f = open(path, 'wb')
+    f.write(pack("<64s", "Synthetic dictionary"))
+    f.write(pack("<16L", *a))
+    f.write(index)
+    for record in records:
+        f.write(array('B', record).tostring())
+    f.close()
+
+def generate(path, count, smallIndex, seed):
+    """Write synthetic dictionary with given number of records"""
+    r = random.Random(seed)
+    alphabet = Alphabet(smallIndex)
+    write_trd(path, [random_record(r, alphabet) for k in range(count)], smallIndex)
+
+class StringPositions(RecordReader):
+    """Record reader remembering positions of strings"""
+    __slots__ = ('positions',)
+
+    def __init__(self, stream, dictionary):
+        RecordReader.__init__(self, stream, dictionary)
+        self.positions = []
+
+    def read_str(self, comment = ""):
+        self.positions.append(self.pos)
+        return RecordReader.read_str(self, comment)